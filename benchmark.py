@@ -0,0 +1,277 @@
+# Headless benchmarks for opening, paginating and paging through books.
+#
+#   python benchmark.py                           # TXT, EPUB and PDF (PDF needs PyMuPDF)
+#   python benchmark.py --words 500000 --formats txt --output before.json
+#   python benchmark.py --compare before.json     # run again and show the change
+#   xvfb-run python benchmark.py --tk             # real font layout and tk.Text updates
+#
+# Books are generated in a temporary folder, then each format is read in a
+# process of its own, so peak RSS is the reader's alone and per book. Without
+# --tk pages are laid out by word count and no widget is touched. Times are in
+# seconds.
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows; peak RSS isn't reported
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FORMATS = ['txt', 'epub', 'pdf']
+CHAPTER_WORDS = 5000
+VOCABULARY = ('the of and to in a is that for it as was with be by on not he I this are or his from at which but have an they you were '
+              'reader page morning river window garden letter quietly remembered afterwards extraordinary').split()  # no "chapter": it forces a page break
+
+def synthetic_chapters(words, seed=1):
+    # Lists of paragraphs, one list per chapter
+    rng = random.Random(seed)
+    chapters = []
+    for start in range(0, words, CHAPTER_WORDS):
+        paragraphs = []
+        left = min(CHAPTER_WORDS, words - start)
+        while left > 0:
+            n = min(left, rng.randint(40, 160))
+            paragraphs.append(' '.join(rng.choice(VOCABULARY) for _ in range(n)).capitalize() + '.')
+            left -= n
+        chapters.append(paragraphs)
+    return chapters
+
+def make_txt(path, chapters):
+    with open(path, 'w', encoding='utf-8') as f:
+        for n, paragraphs in enumerate(chapters, 1):
+            f.write(f'Chapter {n}\n\n' + '\n\n'.join(paragraphs) + '\n\n')
+
+def make_epub(path, chapters):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('mimetype', 'application/epub+zip', zipfile.ZIP_STORED)
+        z.writestr('META-INF/container.xml', '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+                   '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles></container>')
+        items, refs = [], []
+        for n, paragraphs in enumerate(chapters, 1):
+            body = ''.join(f'<p>{p}</p>' for p in paragraphs)
+            z.writestr(f'OEBPS/ch{n}.xhtml', f'<html xmlns="http://www.w3.org/1999/xhtml"><head><title>Chapter {n}</title></head>'
+                       f'<body><h1>Chapter {n}</h1>{body}</body></html>')
+            items.append(f'<item id="ch{n}" href="ch{n}.xhtml" media-type="application/xhtml+xml"/>')
+            refs.append(f'<itemref idref="ch{n}"/>')
+        z.writestr('OEBPS/content.opf', '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="2.0">'
+                   '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>Benchmark</dc:title></metadata>'
+                   f'<manifest>{"".join(items)}</manifest><spine>{"".join(refs)}</spine></package>')
+
+def make_pdf(path, chapters, fitz):
+    # Roughly 350 words per A5 page
+    doc = fitz.open()
+    for n, paragraphs in enumerate(chapters, 1):
+        words = f'Chapter {n}\n\n{chr(10).join(paragraphs)}'.split(' ')
+        for i in range(0, len(words), 350):
+            page = doc.new_page(width=420, height=595)
+            page.insert_textbox(fitz.Rect(30, 30, 390, 565), ' '.join(words[i:i+350]), fontsize=8)
+    doc.save(path)
+    doc.close()
+
+def wait_for(check, timeout=600):
+    # Polls check() until it returns something truthy, like the UI's after() loop
+    deadline = time.perf_counter() + timeout
+    while True:
+        value = check()
+        if value:
+            return value
+        if time.perf_counter() > deadline:
+            raise TimeoutError('benchmark step timed out')
+        time.sleep(0.001)
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {'p50': pick(0.5), 'p95': pick(0.95), 'max': samples[-1], 'mean': statistics.mean(samples)}
+
+class Harness:
+    def __init__(self, er, args):
+        self.er = er
+        self.args = args
+        self.text_area = None
+        if args.tk:
+            import tkinter as tk
+            root = tk.Tk()
+            self.text_area = tk.Text(root, wrap='word', width=60, height=24, padx=30, pady=20)
+            self.text_area.pack()
+            root.update()
+
+    def layout(self, size):
+        er = self.er
+        if self.text_area is None:
+            return er.WordLayout(size)
+        return er.FontLayout(er.font_metrics(self.text_area, 'Georgia', size), 'Georgia', size, 560, 480)
+
+    def show(self, text):
+        # What ReaderController.set_text does with each page
+        ta = self.text_area
+        if ta is not None:
+            ta.config(state='normal')
+            ta.delete('1.0', 'end')
+            ta.insert('end', text)
+            ta.config(state='disabled')
+            ta.update_idletasks()
+
+    def open(self, path, ext, size):
+        # (loader, book, seconds to open, seconds to the first page on screen)
+        start = time.perf_counter()
+        loader = self.er.BookLoader(path, ext, self.layout(size), self.er.PageCache())
+        loader.start()
+        event = wait_for(lambda: not loader.events.empty() and loader.events.get())
+        if event[0] != 'opened':
+            raise RuntimeError(f'could not open {path}: {event}')
+        book = event[1]
+        opened = time.perf_counter() - start
+        pos = wait_for(book.first)
+        self.show(book.page(pos))
+        return loader, book, opened, time.perf_counter() - start
+
+    def run(self, path, ext):
+        args = self.args
+        result = {}
+        loader, book, result['open'], result['first_page'] = self.open(path, ext, 18)
+        start = time.perf_counter()
+        wait_for(lambda: book.complete)
+        result['paginate'] = result['first_page'] + time.perf_counter() - start
+        result['pages'] = book.known_pages
+        # Page turns at key-repeat speed, bouncing back at either end
+        pos, direction, latencies = book.first(), 1, []
+        for _ in range(args.turns):
+            start = time.perf_counter()
+            nxt = book.neighbour(pos, direction)
+            if nxt is None:
+                direction = -direction
+                nxt = book.neighbour(pos, direction) or pos
+            pos = nxt
+            self.show(book.page(pos))
+            book.prefetch(pos, direction)
+            loader.poke()
+            latencies.append(time.perf_counter() - start)
+            time.sleep(args.turn_interval)
+        result['turn'] = percentiles(latencies)
+        # Font change: the page being read comes back first, then the rest
+        anchor = book.locate(pos)
+        start = time.perf_counter()
+        book.repaginate(self.layout(20), anchor)
+        loader.poke()
+        self.show(book.page(wait_for(lambda: book.find(*anchor))))
+        result['repaginate_first_page'] = time.perf_counter() - start
+        wait_for(lambda: book.complete)
+        result['repaginate'] = time.perf_counter() - start
+        loader.close()
+        # Opening again picks up the page cache
+        loader, book, result['warm_open'], result['warm_first_page'] = self.open(path, ext, 18)
+        loader.close()
+        return result
+
+def generate(fmt, path, words):
+    # Writes the book; returns False if the format can't be generated here
+    chapters = synthetic_chapters(words)
+    if fmt == 'txt':
+        make_txt(path, chapters)
+    elif fmt == 'epub':
+        make_epub(path, chapters)
+    else:
+        try:
+            import fitz
+        except ImportError:
+            return False
+        make_pdf(path, chapters, fitz)
+    return True
+
+def run_child(args):
+    # Reads the book the parent generated in args.workdir
+    os.chdir(args.workdir)  # the app keeps its library and caches in the working directory
+    sys.path.insert(0, HERE)
+    import ebook_reader as er
+    path = os.path.join(er.EBOOKS_DIR, f'bench.{args.child}')
+    result = Harness(er, args).run(path, f'.{args.child}')
+    if resource:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['peak_rss_mb'] = peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return result
+
+def flatten(result, prefix=''):
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+def compare(old, new):
+    for fmt, result in new['results'].items():
+        before = flatten(old.get('results', {}).get(fmt, {}))
+        print(f'\n{fmt}')
+        for key, value in flatten(result).items():
+            if key in before and before[key]:
+                change = (value - before[key]) / before[key] * 100
+                print(f'  {key:28} {before[key]:12.4f} -> {value:12.4f}  {change:+7.1f}%')
+            else:
+                print(f'  {key:28} {"":12} -> {value:12.4f}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark opening, pagination and page turns on synthetic books.')
+    parser.add_argument('--words', type=int, default=200_000, help='words per book (default 200000)')
+    parser.add_argument('--formats', default=','.join(FORMATS), help='comma-separated formats (default txt,epub,pdf)')
+    parser.add_argument('--turns', type=int, default=200, help='page turns to time (default 200)')
+    parser.add_argument('--turn-interval', type=float, default=0.03, help='seconds between page turns (default 0.03)')
+    parser.add_argument('--tk', action='store_true', help='lay out with Tk fonts and time tk.Text updates (needs a display, e.g. xvfb-run)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run to compare with')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        json.dump(run_child(args), sys.stdout)
+        return
+    report = {
+        'params': {'words': args.words, 'turns': args.turns, 'turn_interval': args.turn_interval, 'tk': args.tk},
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': {},
+    }
+    passthrough = ['--words', str(args.words), '--turns', str(args.turns), '--turn-interval', str(args.turn_interval)] + (['--tk'] if args.tk else [])
+    for fmt in args.formats.split(','):
+        workdir = tempfile.mkdtemp(prefix='ebook_bench_')
+        try:
+            path = os.path.join(workdir, 'ebooks', f'bench.{fmt}')
+            os.makedirs(os.path.dirname(path))
+            start = time.perf_counter()
+            if not generate(fmt, path, args.words):
+                report['results'][fmt] = {'skipped': 'PyMuPDF is not installed'}
+                continue
+            result = {'generate': time.perf_counter() - start, 'file_bytes': os.path.getsize(path)}
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', fmt, '--workdir', workdir] + passthrough,
+                                  stdout=subprocess.PIPE, text=True)
+            if proc.returncode:
+                result['error'] = f'exited with status {proc.returncode}'
+            else:
+                result.update(json.loads(proc.stdout))
+            report['results'][fmt] = result
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
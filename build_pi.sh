@@ -3,7 +3,7 @@
 # Usage: bash build_pi.sh
 
 # Install dependencies if needed
-pip3 install --user pyinstaller pymupdf ebooklib
+pip3 install --user pyinstaller pymupdf
 
 # Build the executable
 pyinstaller --onefile --noconsole --add-data "ebooks:ebooks" ebook_reader.py
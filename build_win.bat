@@ -7,7 +7,7 @@ cd /d %~dp0
 
 REM Install required packages
 pip install --upgrade pip
-pip install pyinstaller pymupdf ebooklib
+pip install pyinstaller pymupdf
 
 REM Build the app using the .spec file for correct hidden imports and data
 pyinstaller ebook_reader.spec
@@ -1,531 +1,3179 @@
-import os
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-from tkinter.scrolledtext import ScrolledText
-try:
-    import fitz  # PyMuPDF for PDF
-except ImportError:
-    fitz = None
-try:
-    from ebooklib import epub
-except ImportError:
-    epub = None
-import random
-import json
-import urllib.request
-
-# Dynamically determine supported extensions based on available libraries
-SUPPORTED_EXTENSIONS = set()
-SUPPORTED_EXTENSIONS.add('.txt')
-if fitz:
-    SUPPORTED_EXTENSIONS.add('.pdf')
-if epub:
-    SUPPORTED_EXTENSIONS.add('.epub')
-
-EBOOKS_DIR = 'ebooks'
-REC_FILE = 'recent_reads.json'
-os.makedirs(EBOOKS_DIR, exist_ok=True)
-
-def load_recent_reads():
-    if os.path.exists(REC_FILE):
-        with open(REC_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_recent_reads(data):
-    with open(REC_FILE, 'w') as f:
-        json.dump(data, f)
-
-def load_external_recs():
-    try:
-        with open('external_recommendations.json', 'r') as f:
-            return json.load(f)
-    except Exception:
-        return []
-
-def display_title(fname):
-    name = os.path.splitext(fname)[0]
-    return name.replace('_', ' ').strip()
-
-class EbookReaderApp(tk.Tk):
-    def __init__(self):
-        super().__init__()
-        self.title('Ebook Reader')
-        self.geometry('900x600')
-        self.configure(bg='#eceae4')
-        self.current_book = None
-        self.current_ext = None
-        self.current_pages = []
-        self.current_page_idx = 0
-        self.recent_reads = load_recent_reads()
-        self.show_home()
-        self.bind('<Left>', lambda e: self.prev_page())
-        self.bind('<Right>', lambda e: self.next_page())
-
-    def show_home(self):
-        for widget in self.winfo_children():
-            widget.destroy()
-        home = tk.Frame(self, bg='#eceae4')
-        home.pack(fill='both', expand=True)
-        # Center content
-        center = tk.Frame(home, bg='#eceae4')
-        center.place(relx=0.5, rely=0.5, anchor='center')
-        # App icon (simple emoji)
-        tk.Label(center, text='📚', bg='#eceae4', font=('Segoe UI', 48)).pack(pady=(0, 10))
-        tk.Label(center, text='Welcome to Ebook Reader', bg='#eceae4', fg='#222', font=('Segoe UI', 24, 'bold')).pack(pady=(0, 20))
-        rec = self.get_recommendation()
-        if rec:
-            tk.Label(center, text='Recommended for you:', bg='#eceae4', fg='#444', font=('Segoe UI', 14, 'bold')).pack(pady=(0, 5))
-            tk.Label(center, text=rec, bg='#eceae4', fg='#2d3e50', font=('Segoe UI', 16, 'bold')).pack(pady=(0, 15))
-        ext_recs = load_external_recs()
-        if ext_recs:
-            tk.Label(center, text='Recommended from Online:', bg='#eceae4', fg='#444', font=('Segoe UI', 14, 'bold')).pack(pady=(10, 5))
-            for ext in ext_recs:
-                card = tk.Frame(center, bg='#f5f5f3', bd=1, relief='solid')
-                card.pack(pady=4, padx=10, fill='x')
-                tk.Label(card, text=ext['title'], bg='#f5f5f3', fg='#2d3e50', font=('Segoe UI', 12, 'bold')).pack(side='left', padx=10, pady=5)
-                tk.Button(card, text='Add to Library', command=lambda e=ext: self.download_external(e), font=('Segoe UI', 10, 'bold'), bg='#bdb7a4', fg='#222').pack(side='right', padx=10, pady=5)
-        tk.Button(center, text='Go to Library', command=self.show_library, font=('Segoe UI', 15, 'bold'), bg='#4caf50', fg='white', width=18, height=2).pack(pady=30)
-
-    def download_external(self, ext):
-        fname = ext['title'].replace(' ', '_').replace('(', '').replace(')', '').replace("'", "") + '.' + ext['type']
-        dest = os.path.join(EBOOKS_DIR, fname)
-        if os.path.exists(dest):
-            messagebox.showinfo('Info', 'Ebook already in library.')
-            return
-        try:
-            with urllib.request.urlopen(ext['source']) as response, open(dest, 'wb') as out:
-                content = response.read()
-                # If chapter, just take first 3000 chars
-                if ext['type'] == 'txt' and 'Chapter 1' in ext['title']:
-                    content = content[:3000]
-                out.write(content)
-            messagebox.showinfo('Success', f'Added "{ext["title"]}" to library!')
-        except Exception as e:
-            messagebox.showerror('Error', f'Failed to download: {e}')
-
-    def get_recommendation(self):
-        files = [f for f in os.listdir(EBOOKS_DIR) if os.path.splitext(f)[1].lower() in SUPPORTED_EXTENSIONS]
-        if not files:
-            return None
-        unread = [f for f in files if f not in self.recent_reads]
-        if unread:
-            return random.choice(unread)
-        # Recommend least recently opened
-        sorted_reads = sorted(self.recent_reads.items(), key=lambda x: x[1])
-        return sorted_reads[0][0] if sorted_reads else random.choice(files)
-
-    def show_library(self):
-        for widget in self.winfo_children():
-            widget.destroy()
-        lib_frame = tk.Frame(self, bg='#eceae4')
-        lib_frame.pack(fill='both', expand=True)
-        # Header
-        header = tk.Frame(lib_frame, bg='#eceae4')
-        header.pack(pady=(30, 10), fill='x')
-        tk.Button(header, text='🏠 Home', command=self.show_home, font=('Segoe UI', 13, 'bold'), bg='#bdb7a4', fg='#222', bd=0, padx=14, pady=8, activebackground='#bdb7a4', activeforeground='#222').pack(side='left', padx=10)
-        tk.Label(header, text='My Library', bg='#eceae4', fg='#222', font=('Segoe UI', 28, 'bold')).pack(side='left', padx=20)
-        upload_btn = tk.Button(header, text='＋ Add Ebook(s)', command=self.upload_ebook, font=('Segoe UI', 13, 'bold'), bg='#4caf50', fg='white', bd=0, padx=18, pady=8, activebackground='#388e3c', activeforeground='white')
-        upload_btn.pack(side='right', padx=10)
-        remove_btn = tk.Button(header, text='🗑 Remove Selected', command=lambda: None, font=('Segoe UI', 13, 'bold'), bg='#e53935', fg='white', bd=0, padx=18, pady=8, activebackground='#b71c1c', activeforeground='white')
-        remove_btn.pack(side='right', padx=10)
-        # Grid area
-        grid_frame = tk.Frame(lib_frame, bg='#eceae4')
-        grid_frame.pack(expand=True, fill='both', padx=30, pady=10)
-        # List all books in a grid
-        books = [f for f in os.listdir(EBOOKS_DIR) if os.path.splitext(f)[1].lower() in SUPPORTED_EXTENSIONS]
-        self.grid_cards = []
-        columns = 4
-        self.selected_card_idx = None
-        def on_card_click(idx):
-            # Deselect all
-            for i, card in enumerate(self.grid_cards):
-                card.config(bg='#f5f5f3')
-            # Select this one
-            self.grid_cards[idx].config(bg='#bdb7a4')
-            self.selected_card_idx = idx
-        for idx, fname in enumerate(books):
-            row, col = divmod(idx, columns)
-            card = tk.Frame(grid_frame, bg='#f5f5f3', bd=2, relief='ridge', width=180, height=90)
-            card.grid(row=row, column=col, padx=16, pady=16, sticky='nsew')
-            card.grid_propagate(False)
-            title = display_title(fname)
-            label = tk.Label(card, text=title, bg='#f5f5f3', fg='#2d3e50', font=('Segoe UI', 13, 'bold'), wraplength=160, justify='center')
-            label.pack(expand=True, fill='both', padx=8, pady=8)
-            card.bind('<Button-1>', lambda e, i=idx: on_card_click(i))
-            label.bind('<Button-1>', lambda e, i=idx: on_card_click(i))
-            card.bind('<Double-Button-1>', lambda e, f=fname: self.open_reader_page_grid(f))
-            label.bind('<Double-Button-1>', lambda e, f=fname: self.open_reader_page_grid(f))
-            self.grid_cards.append(card)
-        # Make grid expand
-        for c in range(columns):
-            grid_frame.grid_columnconfigure(c, weight=1)
-        for r in range((len(books) + columns - 1) // columns):
-            grid_frame.grid_rowconfigure(r, weight=1)
-        def remove_ebook_grid():
-            if self.selected_card_idx is None:
-                messagebox.showinfo('Info', 'No ebook selected.')
-                return
-            fname = books[self.selected_card_idx]
-            confirm = messagebox.askyesno('Remove Ebook', f'Are you sure you want to remove "{display_title(fname)}"?')
-            if confirm:
-                try:
-                    os.remove(os.path.join(EBOOKS_DIR, fname))
-                    self.show_library()
-                except Exception as e:
-                    messagebox.showerror('Error', f'Failed to remove ebook: {e}')
-        remove_btn.config(command=remove_ebook_grid)
-
-    def open_reader_page_grid(self, fname):
-        ext = os.path.splitext(fname)[1].lower()
-        path = os.path.join(EBOOKS_DIR, fname)
-        # PDF support check
-        if ext == '.pdf' and not fitz:
-            messagebox.showerror('PDF Not Supported', 'PDF support requires the PyMuPDF (fitz) library. Please install it to read PDF files.')
-            return
-        for widget in self.winfo_children():
-            widget.destroy()
-        reader_frame = tk.Frame(self, bg='#eceae4')
-        reader_frame.pack(fill='both', expand=True)
-        # Top bar
-        topbar = tk.Frame(reader_frame, bg='#f5f5f3', height=48, bd=0, relief='flat')
-        topbar.pack(side='top', fill='x')
-        tk.Button(topbar, text='🏠 Home', command=self.show_home, font=('Segoe UI', 12, 'bold'), bg='#bdb7a4', fg='#222', bd=0, padx=12, pady=6).pack(side='left', padx=10, pady=8)
-        tk.Button(topbar, text='⟵ Back to Library', command=self.show_library, font=('Segoe UI', 12, 'bold'), bg='#bdb7a4', fg='#222', bd=0, padx=12, pady=6).pack(side='left', padx=10, pady=8)
-        tk.Label(topbar, text=display_title(fname), bg='#f5f5f3', fg='#222', font=('Segoe UI', 16, 'bold')).pack(side='left', padx=20, pady=8)
-        # Font controls
-        font_frame = tk.Frame(reader_frame, bg='#eceae4')
-        font_frame.pack(fill='x', pady=(5, 0))
-        tk.Label(font_frame, text='Font:', bg='#eceae4', fg='#444', font=('Segoe UI', 11)).pack(side='left', padx=(20, 2))
-        font_families = ['Georgia', 'Arial', 'Times New Roman', 'Courier New', 'Segoe UI']
-        font_var = tk.StringVar(value='Georgia')
-        font_menu = tk.OptionMenu(font_frame, font_var, *font_families)
-        font_menu.pack(side='left', padx=2)
-        tk.Label(font_frame, text='Size:', bg='#eceae4', fg='#444', font=('Segoe UI', 11)).pack(side='left', padx=(16, 2))
-        size_var = tk.IntVar(value=18)
-        size_menu = tk.OptionMenu(font_frame, size_var, *[str(s) for s in range(10, 33, 2)])
-        size_menu.pack(side='left', padx=2)
-        # Progress/Time bar
-        info_frame = tk.Frame(reader_frame, bg='#eceae4')
-        info_frame.pack(fill='x', pady=(5, 0))
-        progress_label = tk.Label(info_frame, text='', bg='#eceae4', fg='#444', font=('Segoe UI', 12, 'bold'))
-        progress_label.pack(side='left', padx=20)
-        time_label = tk.Label(info_frame, text='', bg='#eceae4', fg='#888', font=('Segoe UI', 12))
-        time_label.pack(side='right', padx=20)
-        # Navigation
-        nav_frame = tk.Frame(reader_frame, bg='#eceae4')
-        nav_frame.pack(pady=(10, 0))
-        prev_btn = tk.Button(nav_frame, text='⟨', font=('Segoe UI', 20, 'bold'), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222', width=3, height=1)
-        prev_btn.pack(side='left', padx=20)
-        # Ensure page_label is defined before show_page
-        page_label = tk.Label(nav_frame, text='', bg='#eceae4', fg='#888', font=('Segoe UI', 10))
-        page_label.pack(side='left', padx=10)
-        next_btn = tk.Button(nav_frame, text='⟩', font=('Segoe UI', 20, 'bold'), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222', width=3, height=1)
-        next_btn.pack(side='left', padx=20)
-        # Reading text area (no scroll)
-        text_area = tk.Text(reader_frame, wrap='word', font=(font_var.get(), size_var.get()), bg='#f9fafc', fg='#222', bd=0, relief='flat', padx=30, pady=20, height=12)
-        text_area.pack(fill='both', expand=True, padx=0, pady=(0, 10))
-        text_area.config(state='disabled')
-        self.text_area = text_area  # For touch_flip
-        # Load and paginate book
-        if ext == '.txt':
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                text = f.read()
-        elif ext == '.pdf' and fitz:
-            try:
-                doc = fitz.open(path)
-                text = '\n'.join(page.get_text() for page in doc)
-            except Exception as e:
-                text = f'Error reading PDF: {e}'
-        elif ext == '.epub' and epub:
-            try:
-                book = epub.read_epub(path)
-                text = ''
-                for item in book.get_items():
-                    if item.get_type() == epub.ITEM_DOCUMENT:
-                        text += item.get_content().decode('utf-8', errors='ignore')
-                import re
-                text = re.sub('<[^<]+?>', '', text)
-            except Exception as e:
-                text = f'Error reading EPUB: {e}'
-        else:
-            text = f'Unsupported file type: {ext}. Please add support for this format.'
-        # Pagination logic (by word count)
-        def get_words_per_page():
-            base = 250  # base words for size 18
-            size = size_var.get()
-            return max(60, int(base * 18 / size))
-        def paginate_by_words(text):
-            import re
-            words = text.split()
-            words_per_page = get_words_per_page()
-            pages = []
-            current_page = []
-            count = 0
-            chapter_pattern = re.compile(r'^chapter\b', re.IGNORECASE)
-            for word in words:
-                # If this word starts a chapter, start a new page
-                if chapter_pattern.match(word) and current_page:
-                    pages.append(' '.join(current_page))
-                    current_page = []
-                    count = 0
-                current_page.append(word)
-                count += 1
-                if count >= words_per_page:
-                    pages.append(' '.join(current_page))
-                    current_page = []
-                    count = 0
-            if current_page:
-                pages.append(' '.join(current_page))
-            return pages or ['']
-        pages = paginate_by_words(text)
-        # Navigation logic
-        state = {'idx': 0}
-        def show_page(idx):
-            state['idx'] = max(0, min(idx, len(pages)-1))
-            text_area.config(state='normal')
-            text_area.delete('1.0', tk.END)
-            text_area.insert(tk.END, pages[state['idx']])
-            text_area.config(state='disabled')
-            page_label.config(text=f'Page {state["idx"]+1} of {len(pages)}')
-            prev_btn.config(state='normal' if state['idx'] > 0 else 'disabled')
-            next_btn.config(state='normal' if state['idx'] < len(pages)-1 else 'disabled')
-        prev_btn.config(command=lambda: show_page(state['idx']-1))
-        next_btn.config(command=lambda: show_page(state['idx']+1))
-        def update_font(*args):
-            text_area.config(font=(font_var.get(), size_var.get()))
-            nonlocal pages
-            pages = paginate_by_words(text)
-            show_page(state['idx'])
-        font_var.trace_add('write', update_font)
-        size_var.trace_add('write', update_font)
-        show_page(0)
-
-    def create_widgets(self):
-        self.topbar = tk.Frame(self, bg='#f5f5f3', height=40)
-        self.topbar.pack(side='top', fill='x')
-        self.title_label = tk.Label(self.topbar, text='Select an ebook', bg='#f5f5f3', fg='#222', font=('Segoe UI', 15, 'bold'))
-        self.title_label.pack(side='left', padx=20, pady=5)
-        self.sidebar = tk.Frame(self, width=180, bg='#d6d3c4')
-        self.sidebar.pack(side='left', fill='y')
-        self.library_label = tk.Label(self.sidebar, text='Library', bg='#d6d3c4', fg='#222', font=('Segoe UI', 13, 'bold'))
-        self.library_label.pack(pady=10)
-        self.library_list = tk.Listbox(self.sidebar, bg='#f5f5f3', fg='#222', font=('Segoe UI', 11), selectbackground='#bdb7a4')
-        self.library_list.pack(fill='both', expand=True, padx=10, pady=5)
-        self.library_list.bind('<<ListboxSelect>>', self.on_select_ebook)
-        self.upload_btn = tk.Button(self.sidebar, text='Upload Ebook', command=self.upload_ebook, bg='#bdb7a4', fg='#222', font=('Segoe UI', 10, 'bold'))
-        self.upload_btn.pack(pady=10, padx=10, fill='x')
-        self.reader_frame = tk.Frame(self, bg='#eceae4')
-        self.reader_frame.pack(side='right', fill='both', expand=True)
-        nav_frame = tk.Frame(self.reader_frame, bg='#eceae4')
-        nav_frame.pack(pady=10)
-        self.prev_btn = tk.Button(nav_frame, text='⟨', command=self.prev_page, font=('Segoe UI', 18), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222')
-        self.prev_btn.pack(side='left', padx=30)
-        self.page_label = tk.Label(nav_frame, text='', bg='#eceae4', fg='#888', font=('Segoe UI', 10))
-        self.page_label.pack(side='left', padx=10)
-        self.next_btn = tk.Button(nav_frame, text='⟩', command=self.next_page, font=('Segoe UI', 18), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222')
-        self.next_btn.pack(side='left', padx=30)
-        # Use a regular Text widget, no scroll
-        self.text_area = tk.Text(self.reader_frame, wrap='word', font=('Georgia', 15), bg='#f5f5f3', fg='#222', bd=0, relief='flat', padx=40, pady=20, height=12)
-        self.text_area.pack(fill='both', expand=True, padx=60, pady=10)
-        self.text_area.config(state='disabled')
-
-    def touch_flip(self, event):
-        widget = event.widget
-        # Only handle if widget is a text area
-        if not hasattr(self, 'text_area') or widget != self.text_area:
-            return
-        width = self.text_area.winfo_width()
-        x = event.x
-        if x < width // 3:
-            # Simulate left arrow
-            self.text_area.event_generate('<<PrevPage>>')
-        elif x > 2 * width // 3:
-            # Simulate right arrow
-            self.text_area.event_generate('<<NextPage>>')
-
-    def refresh_library(self):
-        self.library_list.delete(0, tk.END)
-        for fname in os.listdir(EBOOKS_DIR):
-            if os.path.splitext(fname)[1].lower() in SUPPORTED_EXTENSIONS:
-                self.library_list.insert(tk.END, display_title(fname))
-
-    def upload_ebook(self):
-        # Only allow supported file types in the dialog
-        filetypes = [(f'{ext.upper()} files', f'*{ext}') for ext in SUPPORTED_EXTENSIONS]
-        file_path = filedialog.askopenfilename(title='Select Ebook', filetypes=filetypes)
-        if file_path:
-            fname = os.path.basename(file_path)
-            dest = os.path.join(EBOOKS_DIR, fname)
-            if os.path.exists(dest):
-                messagebox.showinfo('Info', 'Ebook already exists in library.')
-                return
-            try:
-                with open(file_path, 'rb') as src, open(dest, 'wb') as dst:
-                    dst.write(src.read())
-                self.refresh_library()
-            except Exception as e:
-                messagebox.showerror('Error', f'Failed to add ebook: {e}')
-
-    def on_select_ebook(self, event):
-        selection = self.library_list.curselection()
-        if not selection:
-            return
-        fname = self.library_list.get(selection[0])
-        self.open_reader_window(fname)
-
-    def open_reader_window(self, fname):
-        ext = os.path.splitext(fname)[1].lower()
-        path = os.path.join(EBOOKS_DIR, fname)
-        reader_win = tk.Toplevel(self)
-        reader_win.title(fname)
-        reader_win.geometry('700x500')
-        reader_win.configure(bg='#eceae4')
-        title_label = tk.Label(reader_win, text=display_title(fname), bg='#f5f5f3', fg='#222', font=('Segoe UI', 15, 'bold'))
-        title_label.pack(side='top', fill='x', pady=5)
-        # Font controls
-        font_frame = tk.Frame(reader_win, bg='#eceae4')
-        font_frame.pack(fill='x', pady=(5, 0))
-        tk.Label(font_frame, text='Font:', bg='#eceae4', fg='#444', font=('Segoe UI', 11)).pack(side='left', padx=(20, 2))
-        font_families = ['Georgia', 'Arial', 'Times New Roman', 'Courier New', 'Segoe UI']
-        font_var = tk.StringVar(value='Georgia')
-        font_menu = tk.OptionMenu(font_frame, font_var, *font_families)
-        font_menu.pack(side='left', padx=2)
-        tk.Label(font_frame, text='Size:', bg='#eceae4', fg='#444', font=('Segoe UI', 11)).pack(side='left', padx=(16, 2))
-        size_var = tk.IntVar(value=18)
-        size_menu = tk.OptionMenu(font_frame, size_var, *[str(s) for s in range(10, 33, 2)])
-        size_menu.pack(side='left', padx=2)
-        # Navigation
-        nav_frame = tk.Frame(reader_win, bg='#eceae4')
-        nav_frame.pack(pady=10)
-        prev_btn = tk.Button(nav_frame, text='⟨', font=('Segoe UI', 18), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222')
-        prev_btn.pack(side='left', padx=30)
-        # Ensure page_label is defined before show_page
-        page_label = tk.Label(nav_frame, text='', bg='#eceae4', fg='#888', font=('Segoe UI', 10))
-        page_label.pack(side='left', padx=10)
-        next_btn = tk.Button(nav_frame, text='⟩', font=('Segoe UI', 18), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222')
-        next_btn.pack(side='left', padx=30)
-        # Use a regular Text widget, no scroll
-        text_area = tk.Text(reader_win, wrap='word', font=(font_var.get(), size_var.get()), bg='#f5f5f3', fg='#222', bd=0, relief='flat', padx=40, pady=20, height=12)
-        text_area.pack(fill='both', expand=True, padx=60, pady=10)
-        text_area.config(state='disabled')
-        # Load and paginate book
-        if ext == '.txt':
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                text = f.read()
-        elif ext == '.pdf' and fitz:
-            try:
-                doc = fitz.open(path)
-                text = '\n'.join(page.get_text() for page in doc)
-            except Exception as e:
-                text = f'Error reading PDF: {e}'
-        elif ext == '.epub' and epub:
-            try:
-                book = epub.read_epub(path)
-                text = ''
-                for item in book.get_items():
-                    if item.get_type() == epub.ITEM_DOCUMENT:
-                        text += item.get_content().decode('utf-8', errors='ignore')
-                import re
-                text = re.sub('<[^<]+?>', '', text)
-            except Exception as e:
-                text = f'Error reading EPUB: {e}'
-        else:
-            text = f'Unsupported file type: {ext}. Please add support for this format.'
-        # Pagination logic (by word count)
-        def get_words_per_page():
-            base = 250  # base words for size 18
-            size = size_var.get()
-            return max(60, int(base * 18 / size))
-        def paginate_by_words(text):
-            import re
-            words = text.split()
-            words_per_page = get_words_per_page()
-            pages = []
-            current_page = []
-            count = 0
-            chapter_pattern = re.compile(r'^chapter\b', re.IGNORECASE)
-            for word in words:
-                # If this word starts a chapter, start a new page
-                if chapter_pattern.match(word) and current_page:
-                    pages.append(' '.join(current_page))
-                    current_page = []
-                    count = 0
-                current_page.append(word)
-                count += 1
-                if count >= words_per_page:
-                    pages.append(' '.join(current_page))
-                    current_page = []
-                    count = 0
-            if current_page:
-                pages.append(' '.join(current_page))
-            return pages or ['']
-        pages = paginate_by_words(text)
-        # Navigation logic
-        state = {'idx': 0}
-        def show_page(idx):
-            state['idx'] = max(0, min(idx, len(pages)-1))
-            text_area.config(state='normal')
-            text_area.delete('1.0', tk.END)
-            text_area.insert(tk.END, pages[state['idx']])
-            text_area.config(state='disabled')
-            page_label.config(text=f'Page {state["idx"]+1} of {len(pages)}')
-            prev_btn.config(state='normal' if state['idx'] > 0 else 'disabled')
-            next_btn.config(state='normal' if state['idx'] < len(pages)-1 else 'disabled')
-        prev_btn.config(command=lambda: show_page(state['idx']-1))
-        next_btn.config(command=lambda: show_page(state['idx']+1))
-        def update_font(*args):
-            text_area.config(font=(font_var.get(), size_var.get()))
-            nonlocal pages
-            pages = paginate_by_words(text)
-            show_page(state['idx'])
-        font_var.trace_add('write', update_font)
-        size_var.trace_add('write', update_font)
-        show_page(0)
-
-    def show_page(self, idx):
-        if not self.current_pages:
-            self.text_area.config(state='normal')
-            self.text_area.delete('1.0', tk.END)
-            self.text_area.insert(tk.END, 'No content.')
-            self.text_area.config(state='disabled')
-            self.page_label.config(text='')
-            self.prev_btn.config(state='disabled')
-            self.next_btn.config(state='disabled')
-            return
-        self.current_page_idx = max(0, min(idx, len(self.current_pages)-1))
-        self.text_area.config(state='normal')
-        self.text_area.delete('1.0', tk.END)
-        self.text_area.insert(tk.END, self.current_pages[self.current_page_idx])
-        self.text_area.config(state='disabled')
-        self.page_label.config(text=f'Page {self.current_page_idx+1} of {len(self.current_pages)}')
-        self.prev_btn.config(state='normal' if self.current_page_idx > 0 else 'disabled')
-        self.next_btn.config(state='normal' if self.current_page_idx < len(self.current_pages)-1 else 'disabled')
-        # Update topbar title
-        if self.current_book:
-            self.title_label.config(text=self.current_book)
-        else:
-            self.title_label.config(text='Select an ebook')
-
-    def prev_page(self):
-        if self.current_page_idx > 0:
-            self.show_page(self.current_page_idx - 1)
-
-    def next_page(self):
-        if self.current_page_idx < len(self.current_pages)-1:
-            self.show_page(self.current_page_idx + 1)
-
-    def _on_swipe_start(self, event):
-        self._swipe_x = event.x
-
-    def _on_swipe_end(self, event, show_page, state, total_pages):
-        dx = event.x - getattr(self, '_swipe_x', event.x)
-        threshold = 60  # Minimum pixels to count as a swipe
-        if dx > threshold and state['idx'] > 0:
-            show_page(state['idx']-1)
-        elif dx < -threshold and state['idx'] < total_pages-1:
-            show_page(state['idx']+1)
-
-if __name__ == '__main__':
-    app = EbookReaderApp()
-    app.mainloop()
+import time
+STARTED = time.perf_counter()  # for the time to first frame
+import os
+import importlib.util
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+from tkinter import font as tkfont
+from tkinter.scrolledtext import ScrolledText
+import random
+import json
+import re
+from array import array
+import hashlib
+import tempfile
+import threading
+import queue
+import concurrent.futures
+import multiprocessing
+import sqlite3
+import atexit
+import contextlib
+import io
+import itertools
+import operator
+import codecs
+import mmap
+import posixpath
+import zipfile
+import zlib
+import urllib.parse
+import xml.etree.ElementTree as ET
+from collections import OrderedDict, deque
+from html.parser import HTMLParser
+
+# PyMuPDF is slow to import, so it is only looked for here and imported by
+# load_fitz() when a PDF is first opened
+HAS_FITZ = importlib.util.find_spec('fitz') is not None
+fitz = None
+
+def load_fitz():
+    global fitz
+    if fitz is None:
+        import fitz as module
+        fitz = module
+    return fitz
+
+# Dynamically determine supported extensions based on available libraries
+SUPPORTED_EXTENSIONS = set()
+SUPPORTED_EXTENSIONS.add('.txt')
+SUPPORTED_EXTENSIONS.add('.epub')  # read with zipfile, no extra library needed
+if HAS_FITZ:
+    SUPPORTED_EXTENSIONS.add('.pdf')
+
+EBOOKS_DIR = 'ebooks'
+REC_FILE = 'recent_reads.json'
+READING_FLUSH_SECONDS = 5  # reading positions are written at most this often
+LIBRARY_INDEX_FILE = 'library_index.json'
+SEARCH_INDEX_FILE = 'search_index.sqlite'
+SEARCH_BATCH_POSITIONS = 250_000  # word positions held in memory while indexing a book
+DOWNLOAD_WORKERS = 3  # books fetched at once
+DOWNLOAD_CHUNK = 64 * 1024
+IMPORT_CHUNK = 1024 * 1024
+TXT_SECTION_BYTES = 256 * 1024  # plain text is read in sections of about this size
+PAGE_LOOKAHEAD = 2  # sections paginated ahead of the visible page
+PAGE_PREFETCH = 3  # pages prepared ahead of the visible page
+PAGE_CACHE_CHARS = 2_000_000  # paginated text kept in memory per open book
+PIXMAP_CACHE_BYTES = 64 * 1024 * 1024  # rendered PDF pages kept in memory
+CACHE_DIR = os.path.join(os.path.dirname(EBOOKS_DIR), '.ebook_cache')
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+HASH_FLUSH_SECONDS = 5  # remembered content hashes are written at most this often
+THUMB_DIR = os.path.join(CACHE_DIR, 'thumbs')
+THUMB_MAX_BYTES = 20 * 1024 * 1024
+THUMB_SIZE = (56, 74)  # fits a library card
+THUMB_WORKERS = 2  # processes generating thumbnails
+os.makedirs(EBOOKS_DIR, exist_ok=True)
+FITZ_LOCK = threading.Lock()  # MuPDF isn't safe to call from several threads at once
+PROFILE_ENV = 'EBOOK_READER_PROFILE'  # "1" for timings, or e.g. "cprofile,tracemalloc" for more
+PROFILE_LOG = 'ebook_profile.log'
+
+class _Timer:
+    __slots__ = ('perf', 'name', 'start')
+
+    def __init__(self, perf, name):
+        self.perf = perf
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.perf.record(self.name, time.perf_counter() - self.start)
+
+_NO_TIMER = contextlib.nullcontext()
+
+class Instrumentation:
+    # Opt-in timings of the reader's hot paths, switched on with the
+    # EBOOK_READER_PROFILE environment variable or --profile. Each stage keeps
+    # its most recent samples for percentiles; the summary is appended to
+    # PROFILE_LOG on exit or on F12. When off, timed() hands back one shared
+    # do-nothing context manager.
+    WINDOW = 1000  # samples kept per stage
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.profiler = None
+        self.tracemalloc = None
+
+    def enable(self, options='1'):
+        options = {o.strip().lower() for o in options.split(',')}
+        self.enabled = True
+        if 'cprofile' in options:
+            import cProfile
+            self.profiler = cProfile.Profile()  # profiles the Tk thread
+            self.profiler.enable()
+        if 'tracemalloc' in options:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+            tracemalloc.start(10)
+        atexit.register(self.dump)
+
+    def timed(self, name):
+        return _Timer(self, name) if self.enabled else _NO_TIMER
+
+    def record(self, name, seconds):
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.WINDOW)
+            samples.append(seconds)
+
+    def summary(self):
+        # Stage -> (samples, p50, p95, max), times in milliseconds
+        with self.lock:
+            stages = {name: sorted(samples) for name, samples in self.samples.items()}
+        return {name: (len(s), s[len(s) // 2] * 1000, s[min(len(s) - 1, int(len(s) * 0.95))] * 1000, s[-1] * 1000)
+                for name, s in stages.items()}
+
+    def report(self):
+        return '\n'.join(f'{name:24} n={n:<5} p50={p50:8.2f} ms  p95={p95:8.2f} ms  max={top:8.2f} ms'
+                         for name, (n, p50, p95, top) in sorted(self.summary().items()))
+
+    def dump(self):
+        # Appends the timings to the log, and saves the profile and the top
+        # allocations when those were asked for
+        try:
+            with open(PROFILE_LOG, 'a') as f:
+                f.write(f'--- {time.strftime("%Y-%m-%d %H:%M:%S")}\n{self.report()}\n')
+                if self.tracemalloc and self.tracemalloc.is_tracing():
+                    top = self.tracemalloc.take_snapshot().statistics('lineno')[:20]
+                    f.write('top allocations:\n' + '\n'.join(str(stat) for stat in top) + '\n')
+            if self.profiler:
+                self.profiler.dump_stats('ebook_profile.prof')
+        except OSError:
+            pass
+
+PERF = Instrumentation()
+if os.environ.get(PROFILE_ENV):
+    PERF.enable(os.environ[PROFILE_ENV])
+
+def load_external_recs():
+    try:
+        with open('external_recommendations.json', 'r') as f:
+            return json.load(f)
+    except Exception:
+        return []
+
+def external_fname(ext):
+    # Library file name for an entry of external_recommendations.json
+    return ext['title'].replace(' ', '_').replace('(', '').replace(')', '').replace("'", "") + '.' + ext['type']
+
+def display_title(fname):
+    name = os.path.splitext(fname)[0]
+    return name.replace('_', ' ').strip()
+
+WORD_PATTERN = re.compile(r'\S+')
+SPACE_PATTERN = re.compile(r'\s*')
+CHAPTER_PATTERN = re.compile(r'chapter\b', re.IGNORECASE)
+_skip_patterns = {}
+
+def skip_words(text, pos, n):
+    # Position just past the next n words after pos, in a single regex call
+    pattern = _skip_patterns.get(n)
+    if pattern is None:
+        pattern = re.compile(r'(?:\s*\S+){%d}' % n)
+        if len(_skip_patterns) < 4096:
+            _skip_patterns[n] = pattern
+    return pattern.match(text, pos).end()
+
+def chapter_segments(words):
+    # (first, last) word index ranges, split where a word starts a chapter
+    starts = [i for i, w in enumerate(words) if i and w[0] in 'cC' and CHAPTER_PATTERN.match(w)]
+    bounds = [0] + starts + [len(words)]
+    return [(bounds[k], bounds[k+1]) for k in range(len(bounds) - 1) if bounds[k] < bounds[k+1]]
+
+def word_breaks_to_offsets(text, breaks, total, pos=0):
+    # Turns the word index each page starts at into a flat array of start,
+    # end character offsets; pages are sliced out of the text only when shown
+    pages = array('I')
+    for k, first in enumerate(breaks):
+        last = breaks[k+1] if k+1 < len(breaks) else total
+        pages.append(SPACE_PATTERN.match(text, pos).end())
+        pos = skip_words(text, pos, last - first)
+        pages.append(pos)
+    return pages
+
+# Pagination logic (by word count)
+def words_per_page(size):
+    base = 250  # base words for size 18
+    return max(60, int(base * 18 / size))
+
+def paginate_by_words(text, per_page, start=0, end=None):
+    # Paginates text[start:end] without copying it
+    words = WORD_PATTERN.findall(text, start, len(text) if end is None else end)
+    breaks = []
+    # If a word starts a chapter, start a new page
+    for first, last in chapter_segments(words):
+        breaks.extend(range(first, last, per_page))
+    return word_breaks_to_offsets(text, breaks, len(words), start)
+
+class WordLayout:
+    # Fixed number of words per page, used until the text area has a size
+    def __init__(self, size):
+        self.per_page = words_per_page(size)
+        self.key = ['words', self.per_page]
+
+    def paginate(self, text, start=0, end=None):
+        return paginate_by_words(text, self.per_page, start, end)
+
+class FontMetrics:
+    # Glyph widths of one font, measured once on the Tk thread so loader
+    # threads can lay out text without calling into Tk
+    CHARS = ''.join(chr(c) for c in list(range(32, 127)) + list(range(160, 384)) + list(range(0x2010, 0x2027)))
+
+    def __init__(self, widget, family, size):
+        font = tkfont.Font(root=widget, family=family, size=size)
+        self.widths = {ch: font.measure(ch) for ch in self.CHARS}
+        self.space = self.widths[' ']
+        self.unknown = self.widths['M']
+        self.linespace = font.metrics('linespace')
+        self.word_widths = {}
+
+    def word_widths_of(self, words):
+        cache = self.word_widths
+        if len(cache) > 200_000:
+            cache.clear()
+        widths, unknown = self.widths, self.unknown
+        for word in set(words).difference(cache):
+            cache[word] = sum(widths.get(ch, unknown) for ch in word)
+        return list(map(cache.__getitem__, words))
+
+_font_metrics = {}
+
+def font_metrics(widget, family, size):
+    # Per-font glyph width cache; must be called from the Tk thread
+    metrics = _font_metrics.get((family, size))
+    if metrics is None:
+        metrics = _font_metrics[(family, size)] = FontMetrics(widget, family, size)
+    return metrics
+
+class FontLayout:
+    # Fills pages to the measured size of the text area, wrapping words the
+    # way a tk.Text with wrap='word' does
+    def __init__(self, metrics, family, size, width, height):
+        self.metrics = metrics
+        self.width = max(1, width - 2)  # a little slack for rounding in Tk
+        self.lines = max(1, height // metrics.linespace)
+        self.key = ['font', family, size, self.width, self.lines]
+
+    def paginate(self, text, start=0, end=None):
+        words = WORD_PATTERN.findall(text, start, len(text) if end is None else end)
+        widths = self.metrics.word_widths_of(words)
+        space = self.metrics.space
+        max_width, max_lines = self.width, self.lines
+        breaks = []
+        for first, last in chapter_segments(words):
+            breaks.append(first)
+            line = 1
+            x = -space
+            for i in range(first, last):
+                w = widths[i]
+                x += space + w
+                if x > max_width and x != w:
+                    line += 1
+                    x = w
+                    if line > max_lines:
+                        breaks.append(i)
+                        line = 1
+                if w > max_width:
+                    # Words wider than the line are broken across lines by Tk
+                    line += (w - 1) // max_width
+                    x = w - (w - 1) // max_width * max_width
+        return word_breaks_to_offsets(text, breaks, len(words), start)
+
+def page_text(text, start, end):
+    return ' '.join(text[start:end].split())
+
+class TextSource:
+    # A book held in memory as a single section
+    cacheable = True  # page boundaries may be saved to the page cache
+    cache_text = False  # extracted text is worth saving too (already plain text here)
+
+    def __init__(self, text):
+        self.sections = [text]
+
+    def __len__(self):
+        return len(self.sections)
+
+    def text(self, i):
+        return self.sections[i]
+
+    def close(self):
+        pass
+
+class ErrorSource(TextSource):
+    # Message shown in place of a book that could not be read
+    cacheable = False
+
+def detect_encoding(sample):
+    # Encoding of a plain-text file from its first bytes, and the length of
+    # its byte order mark
+    for bom, encoding in ((codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF16_LE, 'utf-16-le'), (codecs.BOM_UTF16_BE, 'utf-16-be')):
+        if sample.startswith(bom):
+            return encoding, len(bom)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample)  # a character cut off at the end is fine
+        return 'utf-8', 0
+    except UnicodeDecodeError:
+        return 'cp1252', 0
+
+class MappedTextSource:
+    # A plain-text file read through mmap, so even very large files cost
+    # little memory. The file is cut into sections of about TXT_SECTION_BYTES
+    # at paragraph or line breaks, and a section is only decoded when asked for.
+    cacheable = True
+    cache_text = False  # already plain text
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.encoding, start = detect_encoding(self.map[:4096])
+        self.width = 2 if self.encoding.startswith('utf-16') else 1
+        self.offsets = [start]  # byte offset of each section, plus the end
+        while size - self.offsets[-1] > TXT_SECTION_BYTES:
+            self.offsets.append(self.find_break(self.offsets[-1] + TXT_SECTION_BYTES))
+        self.offsets.append(size)
+        if size and hasattr(mmap, 'MADV_DONTNEED'):
+            self.map.madvise(mmap.MADV_DONTNEED)  # drop the pages the scan mapped in
+
+    def find_break(self, target):
+        # Offset just after the first paragraph break in the window after
+        # target, or else the first line break, or else target itself
+        limit = target + TXT_SECTION_BYTES // 4
+        newline, cr = '\n'.encode(self.encoding), '\r'.encode(self.encoding)
+        for mark in (newline * 2, (cr + newline) * 2, newline):
+            i = self.find(mark, target, limit)
+            if i >= 0:
+                return i + len(mark)
+        if self.width == 1:
+            while target > self.offsets[-1] and self.map[target] & 0xC0 == 0x80:
+                target -= 1  # don't split a UTF-8 character
+        return target
+
+    def find(self, sub, start, end):
+        # Like mmap.find, but only at character boundaries for UTF-16
+        while True:
+            i = self.map.find(sub, start, end)
+            if i < 0 or (i - self.offsets[0]) % self.width == 0:
+                return i
+            start = i + 1
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def text(self, i):
+        return self.map[self.offsets[i]:self.offsets[i+1]].decode(self.encoding, errors='replace')
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+class PdfSource:
+    # One section per PDF page; text is only extracted when a page is asked for
+    cacheable = True
+    cache_text = True
+
+    def __init__(self, path):
+        with FITZ_LOCK:
+            self.doc = load_fitz().open(path)
+
+    def __len__(self):
+        return self.doc.page_count
+
+    def text(self, i):
+        try:
+            with FITZ_LOCK:
+                return self.doc.load_page(i).get_text()
+        except Exception as e:
+            return f'Error reading PDF page {i+1}: {e}'
+
+    def close(self):
+        with FITZ_LOCK:
+            self.doc.close()
+
+class HtmlTextExtractor(HTMLParser):
+    # Streaming XHTML to plain text: drops script/style, keeps paragraph breaks
+    BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+                  'blockquote', 'section', 'article', 'pre', 'hr', 'dt', 'dd'}
+    SKIP_TAGS = {'script', 'style', 'head'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.BLOCK_TAGS:
+            self.parts.append('\n\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n\n')
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(re.sub(r'\s+', ' ', data))
+
+    def text(self):
+        text = ''.join(self.parts)
+        text = re.sub(r'[ \t]*\n\s*', '\n\n', text)
+        return re.sub(r' {2,}', ' ', text).strip()
+
+def html_to_text(stream, chunk_size=64 * 1024):
+    parser = HtmlTextExtractor()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        parser.feed(chunk)
+    parser.close()
+    return parser.text()
+
+class EpubSource:
+    # One section per spine item, read from the archive in reading order only
+    # when that chapter is asked for
+    CONTAINER_NS = {'c': 'urn:oasis:names:tc:opendocument:xmlns:container'}
+    OPF_NS = {'opf': 'http://www.idpf.org/2007/opf', 'dc': 'http://purl.org/dc/elements/1.1/'}
+    cacheable = True
+    cache_text = True
+
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path)
+        try:
+            container = ET.fromstring(self.zip.read('META-INF/container.xml'))
+            opf_path = container.find('.//c:rootfile', self.CONTAINER_NS).get('full-path')
+            opf = ET.fromstring(self.zip.read(opf_path))
+            self.title = opf.findtext('.//dc:title', None, self.OPF_NS)
+            self.author = opf.findtext('.//dc:creator', None, self.OPF_NS)
+            base = posixpath.dirname(opf_path)
+            manifest = {}
+            self.cover = None  # (path in the archive, media type) of the cover image
+            cover_id = None
+            for meta in opf.iterfind('.//opf:metadata/opf:meta', self.OPF_NS):
+                if meta.get('name') == 'cover':
+                    cover_id = meta.get('content')  # EPUB 2
+            for item in opf.iterfind('.//opf:manifest/opf:item', self.OPF_NS):
+                href = urllib.parse.unquote(item.get('href', ''))
+                entry = manifest[item.get('id')] = (posixpath.normpath(posixpath.join(base, href)), item.get('media-type', ''))
+                is_image = entry[1].startswith('image/')
+                if is_image and ('cover-image' in item.get('properties', '').split() or item.get('id') == cover_id):
+                    self.cover = entry
+                elif is_image and not self.cover and 'cover' in (item.get('id', '') + href).lower():
+                    self.cover = entry  # best guess when the cover isn't marked
+            self.chapters = []
+            for ref in opf.iterfind('.//opf:spine/opf:itemref', self.OPF_NS):
+                href, media_type = manifest.get(ref.get('idref'), (None, ''))
+                if href and 'html' in media_type:
+                    self.chapters.append(href)
+        except Exception:
+            self.zip.close()
+            raise
+
+    def __len__(self):
+        return len(self.chapters)
+
+    def text(self, i):
+        try:
+            with self.zip.open(self.chapters[i]) as raw:
+                return html_to_text(io.TextIOWrapper(raw, encoding='utf-8', errors='ignore'))
+        except Exception as e:
+            return f'Error reading EPUB chapter {i+1}: {e}'
+
+    def cover_image(self):
+        # (image data, media type), or None if the book has no cover image
+        if not self.cover:
+            return None
+        try:
+            return self.zip.read(self.cover[0]), self.cover[1]
+        except (KeyError, OSError, zipfile.BadZipFile):
+            return None
+
+    def close(self):
+        self.zip.close()
+
+def open_book_source(path, ext):
+    if ext == '.txt':
+        return MappedTextSource(path)
+    elif ext == '.pdf' and HAS_FITZ:
+        try:
+            return PdfSource(path)
+        except Exception as e:
+            return ErrorSource(f'Error reading PDF: {e}')
+    elif ext == '.epub':
+        try:
+            return EpubSource(path)
+        except Exception as e:
+            return ErrorSource(f'Error reading EPUB: {e}')
+    return ErrorSource(f'Unsupported file type: {ext}. Please add support for this format.')
+
+class CachedTextSource:
+    # Text extracted on an earlier open, read back from the page cache a
+    # section at a time
+    cacheable = True
+    cache_text = False
+
+    def __init__(self, path, offsets):
+        self.file = open(path, 'rb')
+        self.offsets = offsets  # byte offset of each section, plus the end
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def text(self, i):
+        self.file.seek(self.offsets[i])
+        return self.file.read(self.offsets[i+1] - self.offsets[i]).decode('utf-8', errors='ignore')
+
+    def close(self):
+        self.file.close()
+
+class CacheTextWriter:
+    # Collects section text in reading order; only published on commit()
+    def __init__(self, cache, digest):
+        self.cache = cache
+        self.digest = digest
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.directory, suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+        self.offsets = [0]
+
+    @property
+    def count(self):
+        return len(self.offsets) - 1
+
+    def add(self, text):
+        data = text.encode('utf-8')
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.cache.path(f'{self.digest}.text'))
+        self.cache.write_json(f'{self.digest}.text.idx', self.offsets)
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+class PageCache:
+    # Extracted text and page boundaries saved on disk, keyed by the content
+    # hash of the book and the layout it was paginated for. Files are trimmed
+    # least recently used first once the directory grows past max_bytes.
+    # Content hashes are remembered in HASHES_FILE, written at most every
+    # HASH_FLUSH_SECONDS (and at exit) rather than once per new hash.
+    HASHES_FILE = 'hashes.json'
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, flush_delay=HASH_FLUSH_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.flush_delay = flush_delay
+        self._hashes = None
+        self._lock = threading.Lock()  # loader threads may hash concurrently
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.flush_hashes)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def content_hash(self, path):
+        # Hashes are remembered per file path until its size or mtime changes
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        with self._lock:
+            known = self._load_hashes().get(key)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        self._remember(key, st, digest)
+        return digest
+
+    def quick_hash(self, path, sample=1024 * 1024):
+        # Cache key from the size, mtime and first and last `sample` bytes,
+        # for files too big to read in full before showing them
+        st = os.stat(path)
+        h = hashlib.sha1(f'{st.st_size}:{st.st_mtime_ns}:'.encode('ascii'))
+        with open(path, 'rb') as f:
+            h.update(f.read(sample))
+            if st.st_size > sample:
+                f.seek(max(sample, st.st_size - sample))
+                h.update(f.read(sample))
+        return 'q' + h.hexdigest()
+
+    def remember_hash(self, path, digest):
+        # For files whose digest was worked out while writing them
+        self._remember(os.path.abspath(path), os.stat(path), digest)
+
+    def _load_hashes(self):
+        if self._hashes is None:
+            self._hashes = self.read_json(self.HASHES_FILE) or {}
+        return self._hashes
+
+    def _remember(self, key, st, digest):
+        with self._lock:
+            self._load_hashes()[key] = [st.st_size, st.st_mtime_ns, digest]
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_delay, self.flush_hashes)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush_hashes(self):
+        # Writes the remembered hashes, leaving out files that no longer exist
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is None:
+                    return  # nothing new since the last write
+                self._timer.cancel()
+                self._timer = None
+                hashes = dict(self._hashes)
+            gone = [key for key in hashes if not os.path.exists(key)]
+            with self._lock:
+                for key in gone:
+                    if self._hashes.get(key) is hashes.pop(key):
+                        del self._hashes[key]
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(hashes, f)
+                os.replace(tmp_path, self.path(self.HASHES_FILE))
+            except OSError:
+                pass
+
+    def read_json(self, name):
+        path = self.path(name)
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            os.utime(path)  # mark as recently used
+            return data
+        except (OSError, ValueError):
+            return None
+
+    def write_json(self, name, data):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path(name))
+        except OSError:
+            return
+        self.trim()
+
+    def trim(self):
+        try:
+            entries = [e for e in os.scandir(self.directory)
+                       if e.is_file() and e.name != self.HASHES_FILE and not e.name.endswith('.tmp')]
+        except OSError:
+            return
+        stats = sorted(((e.stat(), e.path) for e in entries), key=lambda x: x[0].st_mtime)
+        total = sum(st.st_size for st, _ in stats)
+        for st, path in stats:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= st.st_size
+            except OSError:
+                pass
+
+    @staticmethod
+    def layout_key(layout):
+        return hashlib.sha1(json.dumps(layout).encode('utf-8')).hexdigest()[:12]
+
+    def load_pages(self, digest, layout):
+        # Binary file: section count, page offset count per section, offsets
+        path = self.path(f'{digest}-{self.layout_key(layout)}.pages')
+        try:
+            with open(path, 'rb') as f:
+                header = array('I')
+                header.fromfile(f, 1)
+                counts = array('I')
+                counts.fromfile(f, header[0])
+                sections = []
+                for n in counts:
+                    offsets = array('I')
+                    offsets.fromfile(f, n)
+                    sections.append(offsets)
+            os.utime(path)
+            return sections
+        except (OSError, EOFError):
+            return None
+
+    def store_pages(self, digest, layout, section_pages):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                array('I', [len(section_pages)]).tofile(f)
+                array('I', [len(p) for p in section_pages]).tofile(f)
+                for offsets in section_pages:
+                    offsets.tofile(f)
+            os.replace(tmp_path, self.path(f'{digest}-{self.layout_key(layout)}.pages'))
+        except OSError:
+            return
+        self.trim()
+
+    def load_source(self, digest):
+        offsets = self.read_json(f'{digest}.text.idx')
+        path = self.path(f'{digest}.text')
+        try:
+            if offsets and os.path.getsize(path) == offsets[-1]:
+                os.utime(path)
+                return CachedTextSource(path, offsets)
+        except OSError:
+            pass
+        return None
+
+    def text_writer(self, digest):
+        try:
+            return CacheTextWriter(self, digest)
+        except OSError:
+            return None
+
+class PagedBook:
+    # Paginates a source section by section. Page boundaries are kept as
+    # offset arrays for every section seen so far, but the text of far-away
+    # sections is dropped once more than `budget` characters are held.
+    # With a cache, the finished pagination (and the extracted text, for
+    # formats that need extracting) is saved for the next open.
+    # step() does one unit of pagination work and is meant to be called from a
+    # BookLoader thread while the UI reads pages with page().
+    # Positions are (section, page within section) pairs, so a page can be
+    # shown before the sections in front of it have been paginated.
+    PREVIEW_CHARS = 50_000
+
+    def __init__(self, source, layout, digest=None, cache=None,
+                 lookahead=PAGE_LOOKAHEAD, budget=PAGE_CACHE_CHARS, page_ahead=PAGE_PREFETCH):
+        self.source = source
+        self.extract_stage = 'extract.' + type(source).__name__
+        self.digest = digest if source.cacheable else None
+        self.cache = cache if self.digest else None
+        self.lookahead = lookahead
+        self.page_ahead = page_ahead
+        self.budget = budget
+        self.lock = threading.RLock()  # pagination state and the text LRU
+        self.source_lock = threading.Lock()  # sources aren't thread-safe
+        self.generation = 0
+        self.wanted = []  # sections to load ahead of the reader
+        self.wanted_pages = []  # positions whose text to prepare ahead of the reader
+        self.reading = set()  # sections around the reader's page
+        self._pages = OrderedDict()  # position -> page text, for the pages around the reader
+        self.word_counts = [None] * len(source)
+        self._texts = OrderedDict()  # section -> text, least recently used first
+        self._cached_chars = 0
+        self._text_writer = None
+        if self.cache and source.cache_text:
+            self._text_writer = self.cache.text_writer(self.digest)
+        self.repaginate(layout)
+
+    def repaginate(self, layout, anchor=None):
+        # With an anchor (section, offset), a page break is forced at offset
+        # and that section is paginated first, then the ones after it, then
+        # the ones before it
+        with self.lock:
+            n = len(self.source)
+            self.generation += 1
+            self.layout = layout
+            self.anchor = anchor
+            self._pages.clear()
+            self.wanted_pages = []
+            self.section_pages = [None] * n  # array of page start/end offsets per section
+            self.paginated = 0
+            self.saved = not self.cache  # whether this pagination is in the page cache
+            self.section_starts = []  # global index of the first page of each leading paginated section
+            self.known_pages = 0
+            if anchor:
+                self.order = list(range(anchor[0], n)) + list(range(anchor[0]))
+            else:
+                self.order = list(range(n))
+            self.order.reverse()  # popped from the end
+            if self.cache:
+                cached = self.cache.load_pages(self.digest, self.layout.key)
+                if cached is not None and len(cached) == n:
+                    self.order = []
+                    self.saved = True
+                    for s, offsets in enumerate(cached):
+                        self._add_section(s, offsets)
+
+    @property
+    def complete(self):
+        return self.paginated == len(self.source)
+
+    @property
+    def word_count(self):
+        # Known once every section has been through a pagination pass
+        return None if None in self.word_counts else sum(self.word_counts)
+
+    @property
+    def progress(self):
+        return self.paginated / len(self.source) if len(self.source) else 1.0
+
+    def _add_section(self, s, offsets):
+        self.section_pages[s] = offsets
+        self.paginated += 1
+        # Extend the run of leading sections that global page numbers cover
+        while len(self.section_starts) < len(self.section_pages):
+            nxt = self.section_pages[len(self.section_starts)]
+            if nxt is None:
+                break
+            self.section_starts.append(self.known_pages)
+            self.known_pages += len(nxt) // 2
+
+    def _extract(self, s):
+        with self.source_lock, PERF.timed(self.extract_stage):
+            text = self.source.text(s)
+        with self.lock:
+            # Extracted text is saved on the first pass through the book, in
+            # order; sections read ahead of it follow while they are still held
+            writer = self._text_writer
+            if writer and s == writer.count:
+                try:
+                    writer.add(text)
+                    while writer.count in self._texts:
+                        writer.add(self._texts[writer.count])
+                except OSError:
+                    writer.abort()
+                    self._text_writer = None
+        return text
+
+    def _finish(self, generation):
+        # Saves the extracted text and the pagination once both are complete.
+        # A pass anchored at the reader's page has a break forced there, so
+        # the anchor's section is paginated again without it for the cache.
+        with self.lock:
+            if generation != self.generation or self.saved:
+                return
+            self.saved = True
+            writer, self._text_writer = self._text_writer, None
+            section_pages, layout, anchor = list(self.section_pages), self.layout, self.anchor
+        try:
+            if writer:
+                writer.commit()
+            if anchor:
+                section_pages[anchor[0]] = layout.paginate(self.section_text(anchor[0]))
+            self.cache.store_pages(self.digest, layout.key, section_pages)
+        except OSError:
+            pass
+
+    def section_text(self, s):
+        with self.lock:
+            text = self._texts.get(s)
+            if text is not None:
+                self._texts.move_to_end(s)
+                return text
+        text = self._extract(s)
+        with self.lock:
+            if s not in self._texts:
+                self._texts[s] = text
+                self._cached_chars += len(text)
+            # Sections around the reader are kept even when over budget
+            for old in [k for k in self._texts if k != s and k not in self.reading]:
+                if self._cached_chars <= self.budget:
+                    break
+                self._cached_chars -= len(self._texts.pop(old))
+        return text
+
+    def _paginate(self, layout, text, s, anchor):
+        if anchor and anchor[0] == s and 0 < anchor[1] < len(text):
+            before = layout.paginate(text, 0, anchor[1])
+            return before + layout.paginate(text, anchor[1])
+        return layout.paginate(text)
+
+    def step(self):
+        # Loads the sections the reader is about to need, then paginates the
+        # next section. Once all are paginated, reads any sections the text
+        # cache is still missing and saves to the cache. Returns False once
+        # there is nothing left to do.
+        with self.lock:
+            wanted = [w for w in self.wanted if w not in self._texts]
+            self.wanted = []
+            wanted_pages, self.wanted_pages = self.wanted_pages, []
+            s = self.order[-1] if self.order else None
+            generation = self.generation
+            layout, anchor = self.layout, self.anchor
+            missing = finish = None
+            if s is None and self.complete and not self.saved:
+                # Sections skipped over by an anchored or prioritised pass
+                writer = self._text_writer
+                if writer and writer.count < len(self.source):
+                    missing = writer.count
+                else:
+                    finish = True
+            if not wanted and not wanted_pages and s is None and missing is None and not finish:
+                return False
+        for w in wanted:
+            self.section_text(w)
+        for pos in wanted_pages:
+            self.page(pos, generation)
+        if s is not None:
+            with self.lock:
+                text = self._texts.get(s)
+            if text is None:
+                text = self._extract(s)
+            with PERF.timed('paginate.section'):
+                offsets = self._paginate(layout, text, s, anchor)
+            if self.word_counts[s] is None:
+                self.word_counts[s] = len(WORD_PATTERN.findall(text))
+            with self.lock:
+                if generation == self.generation and self.order and self.order[-1] == s:
+                    self.order.pop()
+                    self._add_section(s, offsets)
+        elif missing is not None:
+            self._extract(missing)
+        elif finish:
+            self._finish(generation)
+        return True
+
+    def prioritise(self, s):
+        # Paginate section s next, e.g. to reach a search hit quickly
+        with self.lock:
+            if s in self.order:
+                self.order.remove(s)
+                self.order.append(s)
+
+    def page_count(self, s):
+        offsets = self.section_pages[s]
+        return None if offsets is None else len(offsets) // 2
+
+    def page(self, pos, generation=None):
+        # Text of the page at pos, or None if it hasn't been paginated yet.
+        # The pages around the reader are kept ready (see prefetch)
+        s, i = pos
+        with self.lock:
+            if generation not in (None, self.generation):
+                return None  # prepared for a layout that has since changed
+            generation = self.generation
+            text = self._pages.get(pos)
+            if text is not None:
+                self._pages.move_to_end(pos)
+                return text
+            offsets = self.section_pages[s]
+            if offsets is None or i >= len(offsets) // 2:
+                return None
+            start, end = offsets[2*i], offsets[2*i+1]
+        text = page_text(self.section_text(s), start, end)
+        with self.lock:
+            if generation == self.generation:
+                self._pages[pos] = text
+                while len(self._pages) > 2 * self.page_ahead + 2:
+                    self._pages.popitem(last=False)
+        return text
+
+    def neighbour(self, pos, delta):
+        # The page before (delta=-1) or after (delta=1) pos. None at either end
+        # of the book, False if pagination hasn't got that far yet.
+        s, i = pos
+        i += delta
+        with self.lock:
+            while True:
+                if self.section_pages[s] is None:
+                    return False
+                if 0 <= i < self.page_count(s):
+                    return s, i
+                s += delta
+                if not 0 <= s < len(self.source):
+                    return None
+                count = self.page_count(s)
+                i = 0 if delta > 0 or count is None else count - 1
+
+    def first(self):
+        # First page of the book, or None/False as for neighbour()
+        if not len(self.source):
+            return None
+        return self.neighbour((0, -1), 1)
+
+    def index(self, pos):
+        # Global page number of pos, once the sections before it are paginated
+        s, i = pos
+        with self.lock:
+            if s < len(self.section_starts):
+                return self.section_starts[s] + i
+        return None
+
+    def locate(self, pos):
+        # (section, character offset) where the page at pos starts
+        s, i = pos
+        with self.lock:
+            offsets = self.section_pages[s]
+            if offsets is None or i >= len(offsets) // 2:
+                return None
+            return s, offsets[2*i]
+
+    def find(self, section, offset):
+        # Position of the page containing offset in section, or None if that
+        # section isn't paginated yet
+        with self.lock:
+            offsets = self.section_pages[section]
+            if offsets is None:
+                return None
+            if not offsets:
+                return self.neighbour((section, -1), 1) or self.neighbour((section, 0), -1) or (section, 0)
+            # Last page starting at or before offset
+            lo, hi = 0, len(offsets) // 2
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if offsets[2 * mid] <= offset:
+                    lo = mid
+                else:
+                    hi = mid
+            return section, lo
+
+    def preview(self, anchor):
+        # Text of the page that will start at anchor once repagination gets
+        # there, laid out from a window of text just after the anchor
+        s, offset = anchor
+        text = self.section_text(s)
+        offsets = self.layout.paginate(text, offset, min(len(text), offset + self.PREVIEW_CHARS))
+        return page_text(text, offsets[0], offsets[1]) if offsets else ''
+
+    def prefetch(self, pos, direction=1):
+        # Asks step() to load the sections and prepare the pages the reader
+        # is heading towards, plus the page behind
+        s = pos[0]
+        with self.lock:
+            ahead = range(s + direction, s + direction * (self.lookahead + 1), direction)
+            self.wanted = [w for w in ahead if 0 <= w < len(self.source)]
+            if 0 <= s - direction < len(self.source):
+                self.wanted.append(s - direction)
+            self.reading = {s, *self.wanted}
+            pages = []
+            nxt = pos
+            for _ in range(self.page_ahead):
+                nxt = self.neighbour(nxt, direction)
+                if not nxt:
+                    break
+                pages.append(nxt)
+            behind = self.neighbour(pos, -direction)
+            if behind:
+                pages.append(behind)
+            self.wanted_pages = [p for p in pages if p not in self._pages]
+
+    def close(self):
+        with self.lock:
+            if self._text_writer:
+                self._text_writer.abort()
+                self._text_writer = None
+        with self.source_lock:
+            self.source.close()
+
+def open_book(path, ext, layout, cache):
+    # Reuses text extracted on an earlier open when the file is unchanged.
+    # Plain text is read in place and only its pages are cached, so it is
+    # keyed by a quick hash instead of reading the whole file first.
+    try:
+        with PERF.timed('open.hash'):
+            digest = cache.quick_hash(path) if ext == '.txt' else cache.content_hash(path)
+    except OSError:
+        digest = None
+    with PERF.timed('open.source'):
+        source = cache.load_source(digest) if digest else None
+        if source is None:
+            source = open_book_source(path, ext)
+    return PagedBook(source, layout, digest, cache)
+
+def open_text_source(path, cache):
+    # A book's source for reading its text outside the reader, from the text
+    # cache where possible. Plain text is never in the text cache, so it
+    # isn't hashed.
+    ext = os.path.splitext(path)[1].lower()
+    source = None
+    if ext != '.txt':
+        try:
+            source = cache.load_source(cache.content_hash(path))
+        except OSError:
+            pass
+    return source or open_book_source(path, ext)
+
+class BookLoader(threading.Thread):
+    # Opens and paginates a book off the Tk thread. Progress is posted to
+    # `events` for the UI to pick up with after() polling; the thread then
+    # idles until poke() (e.g. after a repaginate) or close().
+    def __init__(self, path, ext, layout, cache):
+        super().__init__(daemon=True)
+        self.args = (path, ext, layout, cache)
+        self.events = queue.Queue()
+        self.book = None
+        self.wake = threading.Event()
+        self.resting = False  # idle with nothing left to do until poked
+        self._rest_lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self._close_lock = threading.Lock()
+        self._finished = False
+
+    def run(self):
+        try:
+            book = open_book(*self.args)
+            with self._close_lock:
+                self.book = book
+            self.events.put(('opened', book))
+            while not self.cancelled.is_set():
+                self.wake.clear()
+                if book.step():
+                    self.events.put(('progress', book.progress))
+                else:
+                    self.events.put(('done', book.generation))
+                    with self._rest_lock:
+                        self.resting = not self.wake.is_set()
+                    self.wake.wait()
+        except Exception as e:
+            self.events.put(('error', str(e)))
+        finally:
+            with self._close_lock:
+                self._finished = True
+                if self.cancelled.is_set() and self.book:
+                    self.book.close()
+
+    def poke(self):
+        with self._rest_lock:
+            self.resting = False
+            self.wake.set()
+
+    def busy(self):
+        # Whether there is work in progress or events not yet picked up
+        return (self.is_alive() and not self.resting) or not self.events.empty()
+
+    def close(self):
+        # The book is closed here or, if still busy, by the thread on its way out
+        with self._close_lock:
+            self.cancelled.set()
+            self.wake.set()
+            if self._finished and self.book:
+                self.book.close()
+
+class PdfRenderer(threading.Thread):
+    # Rasterises the pages of a PDF with fitz on a worker thread, fitted to the
+    # viewport. Images are kept as PPM data in an LRU bounded by bytes. When
+    # the page in view has no image at all, a quick draft at a third of the
+    # size is rendered first, to be shown scaled up until the sharp one is done.
+    # Finished keys are posted to `events` as ('rendered', key).
+    DRAFT_SCALE = 3
+
+    def __init__(self, path, max_bytes=PIXMAP_CACHE_BYTES, ahead=PAGE_PREFETCH):
+        super().__init__(daemon=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ahead = ahead
+        self.lock = threading.Lock()
+        self.images = OrderedDict()  # (page, width, height) -> PPM data, least recently used first
+        self.nbytes = 0
+        self.failed = set()
+        self.wanted = []  # keys to render, most urgent first
+        self.page_count = None
+        self.events = queue.Queue()
+        self.wake = threading.Event()
+        self.rendering = False
+        self.closed = False
+
+    def request(self, page, direction, width, height):
+        # The page in view, then the ones the reader is heading towards
+        with self.lock:
+            wanted = []
+            if not any(key[0] == page for key in self.images):
+                wanted.append((page, width // self.DRAFT_SCALE, height // self.DRAFT_SCALE))
+            wanted += [(page + direction * k, width, height) for k in range(self.ahead + 1)]
+            wanted.append((page - direction, width, height))
+            self.wanted = [key for key in wanted if key not in self.images and key not in self.failed]
+        self.wake.set()
+
+    def best(self, page, width, height):
+        # (key, data) of the sharp image of page, or else the largest one
+        # there is; (None, None) if there is none yet
+        with self.lock:
+            key = (page, width, height)
+            if key not in self.images:
+                others = [k for k in self.images if k[0] == page]
+                if not others:
+                    return None, None
+                key = max(others, key=lambda k: k[1] * k[2])
+            self.images.move_to_end(key)
+            return key, self.images[key]
+
+    def run(self):
+        try:
+            with FITZ_LOCK:
+                doc = load_fitz().open(self.path)
+                self.page_count = doc.page_count
+        except Exception as e:
+            self.events.put(('error', str(e)))
+            return
+        try:
+            while not self.closed:
+                self.wake.clear()
+                with self.lock:
+                    key = self.wanted.pop(0) if self.wanted else None
+                    self.rendering = key is not None
+                if key is None:
+                    self.wake.wait()
+                    continue
+                page, width, height = key
+                if not 0 <= page < self.page_count or width < 1 or height < 1:
+                    continue
+                try:
+                    data = self.render(doc, page, width, height)
+                except Exception:
+                    with self.lock:
+                        self.failed.add(key)
+                    self.events.put(('failed', key))
+                    continue
+                with self.lock:
+                    self.images[key] = data
+                    self.nbytes += len(data)
+                    while self.nbytes > self.max_bytes and len(self.images) > 1:
+                        _, old = self.images.popitem(last=False)
+                        self.nbytes -= len(old)
+                self.events.put(('rendered', key))
+        finally:
+            with FITZ_LOCK:
+                doc.close()
+
+    def render(self, doc, page, width, height):
+        with FITZ_LOCK, PERF.timed('render.pdf_page'):
+            p = doc.load_page(page)
+            zoom = min(width / p.rect.width, height / p.rect.height)
+            return p.get_pixmap(matrix=load_fitz().Matrix(zoom, zoom), alpha=False).tobytes('ppm')
+
+    def idle(self):
+        # Whether every requested page is done and its event picked up
+        with self.lock:
+            return not self.wanted and not self.rendering and self.events.empty()
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+
+class ReaderController:
+    # Page navigation and font handling shared by the reader views. The book is
+    # loaded by a BookLoader; the text area shows page 1 as soon as it exists.
+    # poll() picks up the loader's progress while the text area is on screen
+    # and stops once there is nothing to wait for; resume() restarts it.
+    POLL_MS = 30
+    RESIZE_DELAY_MS = 200
+
+    def __init__(self, app, fname, text_area, page_label, prev_btn, next_btn, font_var, size_var, target=None,
+                 image_label=None, render_var=None):
+        self.app = app
+        self.text_area = text_area
+        self.page_label = page_label
+        self.prev_btn = prev_btn
+        self.next_btn = next_btn
+        self.font_var = font_var
+        self.size_var = size_var
+        self.fname = fname
+        self.path = os.path.join(EBOOKS_DIR, fname)
+        st = os.stat(self.path) if os.path.exists(self.path) else None
+        self.mtime = st.st_mtime_ns if st else None
+        self.size = st.st_size if st else None
+        self.pos = None  # (section, page) on screen
+        self.anchor = target  # (section, offset) to show once its page is paginated
+        self.book = None
+        self.error = None
+        self.empty = False
+        self.closed = False
+        self.resize_job = None
+        self.direction = 1  # which way the reader is turning pages
+        self.opened_at = time.perf_counter() if PERF.enabled else None
+        self.image_label = image_label
+        self.render_var = render_var
+        self.renderer = None  # PdfRenderer while PDF pages are shown as images
+        self.pdf_page = 0
+        self.photo = None  # PhotoImage on screen and the renderer key it came from
+        self.photo_key = None
+        self.pending_turn = 0  # turns requested since the last redraw
+        self.polling = True
+        ext = os.path.splitext(fname)[1].lower()
+        text_area.update_idletasks()  # so the viewport has its real size
+        self.loader = BookLoader(self.path, ext, self.make_layout(), app.page_cache)
+        prev_btn.config(command=lambda: self.turn(-1))
+        next_btn.config(command=lambda: self.turn(1))
+        # Widgets may outlive the controller, so it only leaves traces that
+        # close() removes; the owner forwards <Configure> to on_resize() and
+        # <Map> to resume()
+        self.traces = [(var, var.trace_add('write', self.update_font)) for var in (font_var, size_var)]
+        self.set_text('Loading…')
+        self.loader.start()
+        if render_var is not None and ext == '.pdf' and HAS_FITZ:
+            self.traces.append((render_var, render_var.trace_add('write', self.update_render_mode)))
+            self.update_render_mode()
+        self.poll()
+
+    def viewport(self):
+        ta = self.text_area
+        inset = int(ta.cget('borderwidth')) + int(ta.cget('highlightthickness'))
+        width = ta.winfo_width() - 2 * (int(ta.cget('padx')) + inset)
+        height = ta.winfo_height() - 2 * (int(ta.cget('pady')) + inset)
+        return width, height
+
+    def make_layout(self):
+        family, size = self.font_var.get(), self.size_var.get()
+        width, height = self.viewport()
+        if width < 50 or height < 20:
+            return WordLayout(size)  # not laid out on screen yet
+        return FontLayout(font_metrics(self.text_area, family, size), family, size, width, height)
+
+    def set_text(self, text):
+        with PERF.timed('tk.set_text'):
+            self.text_area.config(state='normal')
+            self.text_area.delete('1.0', tk.END)
+            self.text_area.insert(tk.END, text)
+            self.text_area.config(state='disabled')
+
+    def poll(self):
+        if self.closed:
+            return
+        try:
+            while True:
+                event = self.loader.events.get_nowait()
+                if event[0] == 'opened':
+                    self.book = event[1]
+                    self.relayout()  # in case the font or window changed while opening
+                    if self.anchor:
+                        self.book.prioritise(self.anchor[0])
+                elif event[0] == 'done' and self.book.word_count is not None:
+                    self.app.library.record_stats(self.fname, self.book.known_pages, self.book.word_count)
+                elif event[0] == 'error':
+                    self.error = event[1]
+                    self.set_text(f'Error opening book: {self.error}')
+        except queue.Empty:
+            pass
+        if self.renderer:
+            self.poll_renderer()
+        if self.book and not self.error:
+            if self.anchor:
+                pos = self.book.find(*self.anchor)
+                if pos:
+                    self.show_page(pos)
+            elif self.pos is None:
+                pos = self.book.first()
+                if pos:
+                    self.show_page(pos)
+                elif pos is None and self.book.complete and not self.empty:
+                    self.empty = True
+                    self.set_text('No content.')
+            self.update_controls()
+        if self.waiting():
+            self.text_area.after(self.POLL_MS, self.poll)
+        else:
+            self.polling = False
+
+    def waiting(self):
+        # Whether poll() has anything to pick up on the next round
+        if not self.text_area.winfo_ismapped():
+            return False  # on a hidden screen or a minimised window
+        return self.loader.busy() or bool(self.renderer and not self.renderer.idle())
+
+    def resume(self):
+        # After the text area is shown again or the reader is given new work
+        if not self.polling and not self.closed:
+            self.polling = True
+            self.text_area.after(self.POLL_MS, self.poll)
+
+    def show_page(self, pos):
+        with PERF.timed('show_page'):
+            text = self.book.page(pos)
+            if text is None:
+                return
+            if self.pos is None and self.opened_at:
+                PERF.record('open.first_page', time.perf_counter() - self.opened_at)
+                self.opened_at = None
+            self.anchor = None
+            self.pos = pos
+            self.set_text(text)
+            self.book.prefetch(pos, self.direction)
+            self.loader.poke()
+            self.resume()
+            self.update_controls()
+            self.save_position(*self.book.locate(pos))
+
+    def save_position(self, section, offset):
+        book = self.book
+        if not book or not len(book.source) or self.app.reading_state is None:
+            return
+        idx = book.index(self.pos) if self.pos and not self.renderer else None
+        if book.complete and idx is not None and book.known_pages:
+            progress = (idx + 1) / book.known_pages
+        else:
+            progress = (section + 1) / len(book.source)
+        self.app.reading_state.record(self.fname, self.size, section, offset, progress)
+
+    def go_to(self, section, offset):
+        # Shows the page holding offset, e.g. a search hit
+        if self.renderer:
+            self.show_pdf_page(section)  # sections of a PDF are its pages
+            return
+        self.anchor = (section, offset)
+        if self.book:
+            pos = self.book.find(section, offset)
+            if pos:
+                self.show_page(pos)
+            else:
+                self.book.prioritise(section)
+                self.loader.poke()
+                self.resume()
+                self.update_controls()
+
+    def turn(self, delta):
+        # Turns are applied once Tk is idle, so a held arrow key that repeats
+        # faster than pages can be drawn skips pages instead of lagging behind
+        if not self.pending_turn:
+            self.text_area.after_idle(self.apply_turns)
+        self.pending_turn += delta
+
+    def apply_turns(self):
+        delta, self.pending_turn = self.pending_turn, 0
+        if self.closed or not delta:
+            return
+        self.direction = 1 if delta > 0 else -1
+        if self.renderer:
+            count = self.renderer.page_count or 1
+            self.show_pdf_page(min(max(self.pdf_page + delta, 0), count - 1))
+            return
+        if not (self.book and self.pos):
+            return
+        pos = self.pos
+        for _ in range(abs(delta)):
+            nxt = self.book.neighbour(pos, self.direction)
+            if not nxt:
+                break
+            pos = nxt
+        if pos != self.pos:
+            self.show_page(pos)
+
+    def update_controls(self):
+        if self.renderer:
+            count = self.renderer.page_count
+            self.page_label.config(text=f'Page {self.pdf_page + 1} of {count}' if count else 'Page …')
+            self.prev_btn.config(state='normal' if self.pdf_page > 0 else 'disabled')
+            self.next_btn.config(state='normal' if count and self.pdf_page < count - 1 else 'disabled')
+            return
+        book = self.book
+        idx = book.index(self.pos) if self.pos else None
+        if self.anchor or idx is None:
+            label = 'Page …'
+        else:
+            total = f'{book.known_pages}' if book.complete else f'{book.known_pages}+'
+            label = f'Page {idx+1} of {total}'
+        if not book.complete:
+            label += f' (loading {int(book.progress * 100)}%)'
+        self.page_label.config(text=label)
+        has_prev = bool(self.pos and book.neighbour(self.pos, -1))
+        has_next = bool(self.pos and book.neighbour(self.pos, 1))
+        self.prev_btn.config(state='normal' if has_prev else 'disabled')
+        self.next_btn.config(state='normal' if has_next else 'disabled')
+
+    def relayout(self):
+        # Repaginates for the current font and viewport, keeping the text that
+        # is on screen now at the top of the page
+        layout = self.make_layout()
+        if not self.book or layout.key == self.book.layout.key:
+            return
+        anchor = self.anchor or (self.book.locate(self.pos) if self.pos else None)
+        self.book.repaginate(layout, anchor)
+        self.loader.poke()
+        self.resume()
+        self.pos = None
+        if anchor:
+            pos = self.book.find(*anchor)
+            if pos:
+                self.show_page(pos)  # this layout was already in the cache
+            else:
+                # Show the anchored page straight away; it becomes a real page
+                # once the loader has paginated its section
+                self.anchor = anchor
+                self.set_text(self.book.preview(anchor))
+        self.update_controls()
+
+    def update_font(self, *args):
+        with PERF.timed('update_font'):
+            self.text_area.config(font=(self.font_var.get(), self.size_var.get()))
+            self.relayout()
+
+    def on_resize(self, event):
+        if self.resize_job:
+            self.text_area.after_cancel(self.resize_job)
+        self.resize_job = self.text_area.after(self.RESIZE_DELAY_MS, self.finish_resize)
+
+    def finish_resize(self):
+        self.resize_job = None
+        if not self.closed:
+            self.relayout()
+            if self.renderer:
+                self.show_pdf_page(self.pdf_page)
+
+    def update_render_mode(self, *args):
+        # Switches a PDF between reflowed text and rendered pages
+        if self.render_var.get() and not self.renderer:
+            if self.anchor:
+                self.pdf_page = self.anchor[0]
+            elif self.pos:
+                self.pdf_page = self.pos[0]
+            self.renderer = PdfRenderer(self.path)
+            self.renderer.start()
+            self.image_label.place(in_=self.text_area, x=0, y=0, relwidth=1, relheight=1)
+            self.show_pdf_page(self.pdf_page)
+        elif not self.render_var.get() and self.renderer:
+            self.stop_rendering()
+            self.go_to(self.pdf_page, 0)
+
+    def stop_rendering(self):
+        self.renderer.close()
+        self.renderer = None
+        self.image_label.place_forget()
+        self.image_label.config(image='', text='')
+        self.photo = self.photo_key = None
+
+    def show_pdf_page(self, page):
+        self.pdf_page = page
+        self.save_position(page, 0)
+        self.renderer.request(page, self.direction, self.text_area.winfo_width(), self.text_area.winfo_height())
+        self.resume()
+        self.draw_pdf_page()
+        self.update_controls()
+
+    def draw_pdf_page(self):
+        width, height = self.text_area.winfo_width(), self.text_area.winfo_height()
+        key, data = self.renderer.best(self.pdf_page, width, height)
+        if key is None:
+            if (self.pdf_page, width, height) in self.renderer.failed:
+                self.image_label.config(image='', text=f'Could not render page {self.pdf_page + 1}.')
+            elif self.photo_key is None or self.photo_key[0] != self.pdf_page:
+                self.image_label.config(image='', text='Rendering…')
+                self.photo = self.photo_key = None
+            return
+        if key == self.photo_key:
+            return
+        photo = tk.PhotoImage(data=data, format='ppm')
+        # Other sizes stand in, scaled by a whole factor, until the sharp one is done
+        w, h = photo.width(), photo.height()
+        if 2 * w <= width and 2 * h <= height:
+            photo = photo.zoom(min(width // w, height // h))
+        elif w > width or h > height:
+            photo = photo.subsample(max(-(-w // width), -(-h // height)))
+        self.photo, self.photo_key = photo, key
+        self.image_label.config(image=photo, text='')
+
+    def poll_renderer(self):
+        try:
+            while True:
+                event = self.renderer.events.get_nowait()
+                if event[0] == 'error':
+                    self.stop_rendering()
+                    self.set_text(f'Error rendering PDF: {event[1]}')
+                    return
+                if event[1][0] == self.pdf_page:
+                    self.draw_pdf_page()
+        except queue.Empty:
+            pass
+        self.update_controls()
+
+    def is_current(self, fname):
+        # Whether this controller already shows fname as it is on disk
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        return not self.closed and not self.error and fname == self.fname and mtime == self.mtime
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.loader.close()
+            if self.renderer:
+                self.stop_rendering()
+            if self.resize_job:
+                self.text_area.after_cancel(self.resize_job)
+            for var, trace in self.traces:
+                try:
+                    var.trace_remove('write', trace)
+                except tk.TclError:
+                    pass
+
+def read_metadata(path):
+    # Title, author and page count stored inside the file, where the format has them
+    ext = os.path.splitext(path)[1].lower()
+    meta = {}
+    try:
+        if ext == '.epub':
+            source = EpubSource(path)
+            source.close()
+            meta = {'title': source.title, 'author': source.author}
+        elif ext == '.pdf' and HAS_FITZ:
+            with FITZ_LOCK, load_fitz().open(path) as doc:
+                info = doc.metadata or {}
+                meta = {'title': info.get('title'), 'author': info.get('author'), 'pages': doc.page_count}
+    except Exception:
+        pass
+    return {k: v.strip() if isinstance(v, str) else v for k, v in meta.items() if v}
+
+class LibraryIndex:
+    # Metadata of the books in EBOOKS_DIR (size, mtime, format, title, author,
+    # page and word counts) kept in a JSON file, so the home and library
+    # screens are drawn without listing and opening every file. refresh() only
+    # rescans when the folder's mtime changes; titles and authors of new or
+    # changed files are read by fill_metadata() on a background thread.
+    def __init__(self, path=LIBRARY_INDEX_FILE, directory=EBOOKS_DIR):
+        self.path = path
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.filling = False
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.entries = data.get('books', {})
+        self.dir_mtime = data.get('dir_mtime')
+        self.version = 0  # bumped whenever the book list or titles change
+        self.pending = [name for name, e in self.entries.items() if not e.get('scanned')]
+
+    def books(self):
+        with self.lock:
+            return sorted(self.entries)
+
+    def get(self, fname):
+        with self.lock:
+            return dict(self.entries.get(fname, {}))
+
+    def title(self, fname):
+        return self.get(fname).get('title') or display_title(fname)
+
+    def refresh(self, force=False):
+        # Returns True if the folder was rescanned
+        try:
+            dir_mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            return False
+        if not force and dir_mtime == self.dir_mtime:
+            return False
+        found = {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext in SUPPORTED_EXTENSIONS and entry.is_file():
+                    found[entry.name] = entry.stat()
+        with self.lock:
+            for name in set(self.entries) - set(found):
+                del self.entries[name]
+            for name, st in found.items():
+                e = self.entries.get(name)
+                if e and e['size'] == st.st_size and e['mtime'] == st.st_mtime_ns:
+                    continue
+                self.entries[name] = {
+                    'size': st.st_size, 'mtime': st.st_mtime_ns,
+                    'format': os.path.splitext(name)[1].lower().lstrip('.'),
+                    'title': display_title(name), 'author': None,
+                    'pages': None, 'words': None, 'scanned': False,
+                }
+                self.pending.append(name)
+            self.dir_mtime = dir_mtime
+            self.version += 1
+        self.save()
+        self.start_fill()
+        return True
+
+    def start_fill(self):
+        with self.lock:
+            if self.filling or not self.pending:
+                return
+            self.filling = True
+        threading.Thread(target=self.fill_metadata, daemon=True).start()
+
+    def fill_metadata(self):
+        try:
+            while True:
+                with self.lock:
+                    if not self.pending:
+                        break
+                    name = self.pending.pop()
+                meta = read_metadata(os.path.join(self.directory, name))
+                with self.lock:
+                    if name in self.entries:
+                        self.entries[name].update(meta, scanned=True)
+                        self.version += 1
+        finally:
+            with self.lock:
+                self.filling = False
+            self.save()
+
+    def record_stats(self, fname, pages, words):
+        with self.lock:
+            e = self.entries.get(fname)
+            if not e or (e.get('pages'), e.get('words')) == (pages, words):
+                return
+            e['pages'] = pages
+            e['words'] = words
+        self.save()
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps({'dir_mtime': self.dir_mtime, 'books': self.entries})
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+class ReadingState:
+    # Where each book was left: (section, offset) of the page on screen, when
+    # it was last opened and how far through it is, in REC_FILE. Updates are
+    # kept in memory and written at most every READING_FLUSH_SECONDS (and at
+    # exit) to a temporary file that replaces the old one, so an SD card sees
+    # few writes and a power cut leaves either the old or the new file.
+    def __init__(self, path=REC_FILE, flush_delay=READING_FLUSH_SECONDS):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.timer = None
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        # Older files only held the time each book was opened
+        self.books = {fname: e if isinstance(e, dict) else {'opened': e} for fname, e in data.items()}
+        atexit.register(self.flush)
+
+    def get(self, fname):
+        with self.lock:
+            return dict(self.books.get(fname, {}))
+
+    def last_opened(self):
+        # fname -> time it was last opened
+        with self.lock:
+            return {fname: e['opened'] for fname, e in self.books.items() if e.get('opened')}
+
+    def position(self, fname, size):
+        # (section, offset) to reopen fname at, unless the file has changed since
+        e = self.get(fname)
+        if 'section' in e and e.get('size') == size:
+            return e['section'], e['offset']
+        return None
+
+    def opened(self, fname):
+        self.update(fname, opened=time.time())
+
+    def record(self, fname, size, section, offset, progress):
+        self.update(fname, size=size, section=section, offset=offset, progress=round(progress * 100, 1))
+
+    def forget(self, fname):
+        with self.lock:
+            self.books.pop(fname, None)
+        self.schedule()
+
+    def update(self, fname, **values):
+        with self.lock:
+            self.books.setdefault(fname, {}).update(values)
+        self.schedule()
+
+    def schedule(self):
+        with self.lock:
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if self.timer is None:
+                    return  # nothing changed since the last write
+                self.timer.cancel()
+                self.timer = None
+                data = json.dumps(self.books)
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+TERM_PATTERN = re.compile(r'\w+')
+
+def pack_positions(positions):
+    # Sorted (section, offset, word number) triples, stored column by column
+    # as the differences between neighbours and zlib-compressed: most words
+    # take a couple of bytes instead of twelve, and unpacking runs in C
+    deltas = array('i')
+    for c in range(3):
+        column = positions[c::3]
+        deltas.extend(map(operator.sub, column, itertools.chain((0,), column)))
+    return zlib.compress(deltas.tobytes())
+
+def unpack_positions(blob):
+    deltas = array('i')
+    deltas.frombytes(zlib.decompress(blob))
+    k = len(deltas) // 3
+    positions = array('I', bytes(len(deltas) * 4))
+    for c in range(3):
+        positions[c::3] = array('I', itertools.accumulate(deltas[c*k:(c+1)*k]))
+    return positions
+
+class SearchIndex:
+    # Inverted index of every book in the library, stored in SQLite: rows per
+    # (term, book) holding the section, offset and word number within the
+    # section of each occurrence (see pack_positions). Long books are written
+    # in parts of about SEARCH_BATCH_POSITIONS positions, so indexing one needs
+    # little memory; parts cover the same sections for every term. sync()
+    # brings it up to date with the library index and is meant to run on a
+    # background thread; search() only reads parts until it has enough hits,
+    # so it is fast enough to call from the UI.
+    VERSION = 4  # bumped when the sections of a format or the postings change, to reindex everything
+
+    def __init__(self, path=SEARCH_INDEX_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.syncing = False
+        self.resync = False
+        with self.connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            if db.execute('PRAGMA user_version').fetchone()[0] != self.VERSION:
+                db.execute('DROP TABLE IF EXISTS postings')
+                db.execute('DROP TABLE IF EXISTS books')
+                db.execute(f'PRAGMA user_version = {self.VERSION}')
+            db.execute('CREATE TABLE IF NOT EXISTS books (id INTEGER PRIMARY KEY, fname TEXT UNIQUE, size INTEGER, mtime INTEGER)')
+            db.execute('CREATE TABLE IF NOT EXISTS postings (term TEXT, book INTEGER, part INTEGER, positions BLOB, PRIMARY KEY (term, book, part)) WITHOUT ROWID')
+        self.db = self.connect()  # for searches on the Tk thread
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def start_sync(self, library, cache):
+        # Runs sync() on a background thread; a request made while one is
+        # running is picked up when it finishes
+        with self.lock:
+            if self.syncing:
+                self.resync = True
+                return
+            self.syncing = True
+        def run():
+            while True:
+                try:
+                    self.sync(library, cache)
+                except (OSError, sqlite3.Error):
+                    pass
+                with self.lock:
+                    if not self.resync:
+                        self.syncing = False
+                        return
+                    self.resync = False
+        threading.Thread(target=run, daemon=True).start()
+
+    def sync(self, library, cache):
+        db = self.connect()
+        try:
+            indexed = {fname: (book_id, size, mtime) for book_id, fname, size, mtime in db.execute('SELECT id, fname, size, mtime FROM books')}
+            current = {fname: library.get(fname) for fname in library.books()}
+            for fname, (book_id, size, mtime) in list(indexed.items()):
+                entry = current.get(fname)
+                if not entry or (entry.get('size'), entry.get('mtime')) != (size, mtime):
+                    with db:
+                        db.execute('DELETE FROM postings WHERE book = ?', (book_id,))
+                        db.execute('DELETE FROM books WHERE id = ?', (book_id,))
+                    indexed.pop(fname)
+            for fname, entry in current.items():
+                if fname not in indexed and entry:
+                    self.index_book(db, fname, entry, cache)
+        finally:
+            db.close()
+
+    def index_book(self, db, fname, entry, cache):
+        source = open_text_source(os.path.join(EBOOKS_DIR, fname), cache)
+        if not source.cacheable:
+            # Unreadable: listed without postings, so it is only tried again once the file changes
+            source.close()
+            with db:
+                db.execute('INSERT INTO books (fname, size, mtime) VALUES (?, ?, ?)', (fname, entry['size'], entry['mtime']))
+            return
+        # One transaction, so a book is either fully indexed or not at all
+        try:
+            with db:
+                cur = db.execute('INSERT INTO books (fname, size, mtime) VALUES (?, ?, ?)', (fname, entry['size'], entry['mtime']))
+                book_id = cur.lastrowid
+                postings = {}
+                held = part = 0
+                for s in range(len(source)):
+                    text = source.text(s)
+                    n = -1
+                    for n, m in enumerate(TERM_PATTERN.finditer(text)):
+                        positions = postings.get(m.group().lower())
+                        if positions is None:
+                            positions = postings[m.group().lower()] = array('I')
+                        positions.extend((s, m.start(), n))
+                    held += n + 1
+                    if held >= SEARCH_BATCH_POSITIONS or s == len(source) - 1:
+                        db.executemany('INSERT INTO postings VALUES (?, ?, ?, ?)',
+                                       ((term, book_id, part, pack_positions(positions)) for term, positions in postings.items()))
+                        postings = {}
+                        held = 0
+                        part += 1
+        finally:
+            source.close()
+
+    def search(self, query, limit=200, per_book=20):
+        # Returns (fname, section, offset) for each place the words of query
+        # appear next to each other, in library order and at most per_book
+        # hits from any one book
+        terms = TERM_PATTERN.findall(query.lower())
+        if not terms:
+            return []
+        books = self.db.execute('SELECT id, fname FROM books WHERE id IN (SELECT book FROM postings WHERE term = ?) '
+                                'ORDER BY fname', (terms[0],)).fetchall()
+        hits = []
+        for book_id, fname in books:
+            found = 0
+            parts = self.db.execute('SELECT part, positions FROM postings WHERE term = ? AND book = ? ORDER BY part', (terms[0], book_id))
+            for part, blob in parts:
+                first = unpack_positions(blob)
+                if len(terms) == 1:
+                    for j in range(0, min(len(first), 3 * (per_book - found)), 3):
+                        hits.append((fname, first[j], first[j+1]))
+                        found += 1
+                        if len(hits) >= limit:
+                            return hits
+                    if found >= per_book:
+                        break
+                    continue
+                # (section, word number) where the phrase starts; the k-th
+                # term must be k words further on in the same section
+                starts = set(zip(first[0::3], first[2::3]))
+                for k, term in enumerate(terms[1:], 1):
+                    row = self.db.execute('SELECT positions FROM postings WHERE term = ? AND book = ? AND part = ?',
+                                          (term, book_id, part)).fetchone()
+                    if row is None:
+                        starts = ()  # no phrase in this part
+                        break
+                    positions = unpack_positions(row[0])
+                    starts = starts.intersection(zip(positions[0::3], map(operator.sub, positions[2::3], itertools.repeat(k))))
+                if not starts:
+                    continue
+                offsets = dict(zip(zip(first[0::3], first[2::3]), first[1::3]))
+                for section, n in sorted(starts)[:per_book - found]:
+                    hits.append((fname, section, offsets[section, n]))
+                    if len(hits) >= limit:
+                        return hits
+                found += min(len(starts), per_book - found)
+                if found >= per_book:
+                    break
+        return hits
+
+def search_snippets(hits, cache, width=60):
+    # Yields the text around each hit, opening each book once and reading
+    # each section once. Slow (books are opened and text extracted), so it is
+    # meant for a background thread.
+    sources = {}
+    texts = OrderedDict()  # (fname, section) -> text of the last few sections read
+    try:
+        for fname, section, offset in hits:
+            text = texts.get((fname, section))
+            if text is None:
+                source = sources.get(fname)
+                if source is None:
+                    source = sources[fname] = open_text_source(os.path.join(EBOOKS_DIR, fname), cache)
+                text = texts[(fname, section)] = source.text(section) if section < len(source) else ''
+                if len(texts) > 8:  # hits come in book and section order
+                    texts.popitem(last=False)
+            yield ' '.join(text[max(0, offset - width // 2):offset + width].split())
+    finally:
+        for source in sources.values():
+            source.close()
+
+class DownloadManager:
+    # Fetches books into dest_dir on a small pool of worker threads. Each file
+    # is streamed to <name>.part and renamed into place once complete; a .part
+    # left by an interrupted download is resumed with an HTTP Range request.
+    # Workers post ('progress', fname), ('done', fname) and ('error', fname, msg)
+    # to events for the UI to poll.
+    def __init__(self, dest_dir=EBOOKS_DIR, workers=DOWNLOAD_WORKERS, timeout=30):
+        self.dest_dir = dest_dir
+        self.workers = workers
+        self.timeout = timeout
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self.lock = threading.Lock()
+        self.active = {}  # fname -> [bytes done, total bytes or None]
+        self.threads = []
+
+    def add(self, url, fname, limit=None):
+        # Queues a download; limit keeps only the first limit bytes. Returns
+        # False if the book is already in the library or being fetched.
+        with self.lock:
+            if fname in self.active or os.path.exists(os.path.join(self.dest_dir, fname)):
+                return False
+            self.active[fname] = [0, limit]
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.work, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+        self.jobs.put((url, fname, limit))
+        return True
+
+    def progress(self):
+        # (books in flight, bytes done, bytes expected or None if unknown)
+        with self.lock:
+            done = sum(d for d, _ in self.active.values())
+            totals = [t for _, t in self.active.values()]
+            return len(self.active), done, None if None in totals else sum(totals)
+
+    def work(self):
+        import http.client  # the HTTP stack is only loaded once something is downloaded
+        while True:
+            url, fname, limit = self.jobs.get()
+            try:
+                self.fetch(url, fname, limit)
+                self.events.put(('done', fname))
+            except (OSError, ValueError, http.client.HTTPException) as e:
+                self.events.put(('error', fname, str(e)))
+            finally:
+                with self.lock:
+                    self.active.pop(fname, None)
+
+    def fetch(self, url, fname, limit=None):
+        import urllib.error
+        import urllib.request
+        dest = os.path.join(self.dest_dir, fname)
+        part = dest + '.part'
+        have = os.path.getsize(part) if os.path.exists(part) else 0
+        if limit is not None and have >= limit:
+            os.replace(part, dest)
+            return
+        request = urllib.request.Request(url)
+        if have:
+            request.add_header('Range', f'bytes={have}-')
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and have:
+                os.replace(part, dest)  # the .part already holds the whole file
+                return
+            raise
+        with response:
+            content_range = response.headers.get('Content-Range', '')
+            if have and not (response.status == 206 and content_range.startswith(f'bytes {have}-')):
+                have = 0  # range ignored; start again from the beginning
+            length = response.headers.get('Content-Length')
+            total = have + int(length) if length else None
+            if limit is not None:
+                total = min(total, limit) if total is not None else limit
+            done = have
+            self._update(fname, done, total)
+            with open(part, 'ab' if have else 'wb') as out:
+                while total is None or done < total:
+                    chunk = response.read(DOWNLOAD_CHUNK)
+                    if not chunk:
+                        break
+                    if limit is not None:
+                        chunk = chunk[:limit - done]
+                    out.write(chunk)
+                    done += len(chunk)
+                    self._update(fname, done, total)
+        if total is not None and done < total:
+            raise OSError(f'connection closed after {done} of {total} bytes')
+        os.replace(part, dest)
+
+    def _update(self, fname, done, total):
+        with self.lock:
+            self.active[fname] = [done, total]
+        self.events.put(('progress', fname))
+
+class BookImporter:
+    # Copies books into dest_dir on a background thread. Each file is copied
+    # in fixed-size chunks to a temporary name, hashed on the way, and renamed
+    # into place only if no book with the same content is already in the
+    # library. Posts ('progress', path, done, size), ('added', path, fname),
+    # ('duplicate', path, existing fname) and ('error', path, msg) to events.
+    def __init__(self, library, cache, dest_dir=EBOOKS_DIR):
+        self.library = library
+        self.cache = cache
+        self.dest_dir = dest_dir
+        self.jobs = queue.Queue()
+        self.events = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.imported = {}  # digest -> fname, for books not yet in the library index
+        self.thread = None
+
+    def add(self, paths):
+        with self.lock:
+            self.pending += len(paths)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.work, daemon=True)
+                self.thread.start()
+        for path in paths:
+            self.jobs.put(path)
+
+    def work(self):
+        while True:
+            path = self.jobs.get()
+            try:
+                fname, duplicate = self.import_file(path)
+                self.events.put(('duplicate' if duplicate else 'added', path, fname))
+            except OSError as e:
+                self.events.put(('error', path, str(e)))
+            finally:
+                with self.lock:
+                    self.pending -= 1
+
+    def import_file(self, path):
+        # Returns (library file name, whether it was already there)
+        size = os.path.getsize(path)
+        h = hashlib.sha1()
+        buf = bytearray(IMPORT_CHUNK)
+        view = memoryview(buf)
+        fd, tmp_path = tempfile.mkstemp(dir=self.dest_dir, suffix='.part')
+        try:
+            with open(path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                done = 0
+                while True:
+                    n = src.readinto(buf)
+                    if not n:
+                        break
+                    h.update(view[:n])
+                    dst.write(view[:n])
+                    done += n
+                    self.events.put(('progress', path, done, size))
+            digest = h.hexdigest()
+            existing = self.find_duplicate(digest, done)
+            if existing:
+                os.remove(tmp_path)
+                return existing, True
+            fname = self.free_name(os.path.basename(path))
+            os.replace(tmp_path, os.path.join(self.dest_dir, fname))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.imported[digest] = fname
+        self.cache.remember_hash(os.path.join(self.dest_dir, fname), digest)
+        return fname, False
+
+    def find_duplicate(self, digest, size):
+        fname = self.imported.get(digest)
+        if fname and os.path.exists(os.path.join(self.dest_dir, fname)):
+            return fname
+        # Only books of the same size can match, so most are never hashed
+        for fname in self.library.books():
+            if self.library.get(fname).get('size') == size:
+                try:
+                    if self.cache.content_hash(os.path.join(self.dest_dir, fname)) == digest:
+                        return fname
+                except OSError:
+                    pass
+        return None
+
+    def free_name(self, fname):
+        # fname, or "name (2).ext" etc. if a different book already has it
+        base, ext = os.path.splitext(fname)
+        n = 1
+        while os.path.exists(os.path.join(self.dest_dir, fname)):
+            n += 1
+            fname = f'{base} ({n}){ext}'
+        return fname
+
+def make_thumbnail(path, ext, out_path, width, height):
+    # Runs in a Thumbnailer worker process. Writes a PNG of the book's cover
+    # (an EPUB's cover image or a PDF's first page) no larger than width x
+    # height, and returns whether the book had one
+    image = None
+    if ext == '.epub':
+        source = EpubSource(path)
+        try:
+            image = source.cover_image()
+        finally:
+            source.close()
+        if image is None:
+            return False
+        if not HAS_FITZ:
+            if image[1] != 'image/png':
+                return False  # Tk reads PNG itself; anything else needs MuPDF
+            data = image[0]  # scaled down when it is shown
+    elif not (ext == '.pdf' and HAS_FITZ):
+        return False
+    if HAS_FITZ:
+        fitz = load_fitz()
+        if image:
+            doc = fitz.open(stream=image[0], filetype=image[1].split('/')[-1])
+        else:
+            doc = fitz.open(path)
+        with doc:
+            page = doc.load_page(0)
+            zoom = min(width / page.rect.width, height / page.rect.height)
+            data = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False).tobytes('png')
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(out_path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, out_path)
+    return True
+
+class Thumbnailer:
+    # Cover thumbnails for the library cards. Books are hashed on a background
+    # thread and their thumbnails made in a process pool, so neither hashing
+    # nor MuPDF holds up the UI. Thumbnails are PNGs in `directory` named by
+    # content hash (an empty .none file marks a book without a cover), trimmed
+    # least recently used first past max_bytes. Books whose thumbnail becomes
+    # known are posted to `ready`. Only one job per worker is handed to the
+    # pool at a time; the rest wait here, where jobs for cards scrolled out of
+    # view are dropped, and close() discards them so exiting only waits for
+    # the covers being made.
+    def __init__(self, cache, directory=THUMB_DIR, max_bytes=THUMB_MAX_BYTES, size=THUMB_SIZE, workers=THUMB_WORKERS):
+        self.cache = cache
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.known = {}  # fname -> thumbnail path, or None if there is no cover
+        self.pending = {}  # fname -> Future, or None while waiting to be hashed
+        self.jobs = queue.Queue()
+        self.ready = queue.Queue()
+        self.pool = None
+        self.slots = threading.Semaphore(workers)  # jobs the pool may have at once
+        self.thread = None
+        self.closed = False
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, fname):
+        # Path of fname's thumbnail, or None while it is being made or if the
+        # book has no cover. Never blocks.
+        with self.lock:
+            if fname in self.known or self.closed:
+                return self.known.get(fname)
+            self.known[fname] = None
+            self.pending[fname] = None
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.work, daemon=True)
+                self.thread.start()
+        self.jobs.put(fname)
+        return None
+
+    def work(self):
+        while True:
+            fname = self.jobs.get()
+            with self.lock:
+                if self.closed:
+                    return
+                if fname not in self.pending:
+                    continue  # dropped while queued
+            ext = os.path.splitext(fname)[1].lower()
+            digest = None
+            if ext in ('.epub', '.pdf'):
+                try:
+                    digest = self.cache.content_hash(os.path.join(EBOOKS_DIR, fname))
+                except OSError:
+                    pass
+            thumb = digest and os.path.join(self.directory, digest + '.png')
+            if thumb and os.path.exists(thumb):
+                os.utime(thumb)  # mark as recently used
+                self.finish(fname, thumb, True)
+            elif not thumb or os.path.exists(os.path.join(self.directory, digest + '.none')):
+                self.finish(fname, thumb, False)
+            else:
+                self.slots.acquire()
+                with self.lock:
+                    if self.closed or fname not in self.pending:
+                        self.slots.release()
+                        continue
+                    if self.pool is None:
+                        # Spawned workers don't inherit the Tk interpreter or the loader threads
+                        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers, multiprocessing.get_context('spawn'))
+                    future = self.pending[fname] = self.pool.submit(make_thumbnail, os.path.join(EBOOKS_DIR, fname), ext, thumb, *self.size)
+                future.add_done_callback(lambda f, fname=fname, thumb=thumb: self.generated(fname, thumb, f))
+
+    def drop(self, fname):
+        # For a card that has left the view: its job is cancelled unless a
+        # worker has already started on it, and asked for again when shown
+        with self.lock:
+            if fname not in self.pending:
+                return
+            future = self.pending[fname]
+            if future is None or future.cancel():
+                del self.pending[fname]
+                self.known.pop(fname, None)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            futures = [f for f in self.pending.values() if f]
+            self.pending.clear()
+            pool = self.pool
+        for future in futures:
+            future.cancel()
+        if pool:
+            pool.shutdown(wait=False)
+        self.jobs.put(None)  # wakes the dispatcher so it can exit
+
+    def generated(self, fname, thumb, future):
+        self.slots.release()
+        if future.cancelled():
+            return
+        try:
+            made = future.result()
+        except Exception:
+            made = False  # unreadable book; tried again next session
+        else:
+            if not made:
+                open(os.path.splitext(thumb)[0] + '.none', 'w').close()
+        self.finish(fname, thumb, made)
+        if made:
+            self.trim()
+
+    def finish(self, fname, thumb, made):
+        with self.lock:
+            self.pending.pop(fname, None)
+            self.known[fname] = thumb if made else None
+        if made:
+            self.ready.put(fname)
+
+    def forget(self, fname):
+        # For a book that changed or was removed
+        with self.lock:
+            self.known.pop(fname, None)
+
+    def trim(self):
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.is_file() and e.name.endswith('.png')]
+            stats = sorted(((e.stat(), e.path) for e in entries), key=lambda x: x[0].st_mtime)
+        except OSError:
+            return
+        total = sum(st.st_size for st, _ in stats)
+        for st, path in stats:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= st.st_size
+            except OSError:
+                pass
+        with self.lock:
+            self.known = {fname: thumb for fname, thumb in self.known.items() if not thumb or os.path.exists(thumb)}
+
+class LibraryGrid(tk.Frame):
+    # Scrolling grid of book cards drawn on a Canvas. Canvas items only exist
+    # for the rows in view and are recycled as the view scrolls, so the cost
+    # of showing the library doesn't grow with the number of books. Covers
+    # come from thumb_of, which returns None until a thumbnail is ready;
+    # refresh() fills a card in when it is.
+    COLUMNS = 4
+    CARD_HEIGHT = 90
+    PAD = 16
+    CARD_BG = '#f5f5f3'
+    SELECTED_BG = '#bdb7a4'
+
+    def __init__(self, parent, books, title_of, on_open, thumb_of=lambda fname: None, thumb_dropped=lambda fname: None):
+        super().__init__(parent, bg='#eceae4')
+        self.books = books
+        self.title_of = title_of
+        self.on_open = on_open
+        self.thumb_of = thumb_of
+        self.thumb_dropped = thumb_dropped  # called for cards leaving the view
+        self.selected = None
+        self.items = {}  # book index -> (card, label, cover) canvas items in view
+        self.free = []  # hidden item triples ready for reuse
+        self.canvas = tk.Canvas(self, bg='#eceae4', highlightthickness=0)
+        scrollbar = tk.Scrollbar(self, orient='vertical', command=self.yview)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        self.canvas.pack(side='left', fill='both', expand=True)
+        self.canvas.bind('<Configure>', lambda e: self.redraw(relayout=True))
+        self.canvas.bind('<Button-1>', self.on_click)
+        self.canvas.bind('<Double-Button-1>', self.on_double_click)
+        self.canvas.bind('<MouseWheel>', lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        self.canvas.bind('<Button-4>', lambda e: self.scroll(-1))
+        self.canvas.bind('<Button-5>', lambda e: self.scroll(1))
+
+    def set_books(self, books):
+        for idx in list(self.items):
+            self.hide(idx)
+        self.books = books
+        self.selected = None
+        self.redraw()
+
+    def hide(self, idx):
+        self.thumb_dropped(self.books[idx])
+        items = self.items.pop(idx)
+        for item in items:
+            self.canvas.itemconfigure(item, state='hidden')
+        self.free.append(items)
+
+    def refresh(self, fname):
+        # Redraws fname's card if it is in view, e.g. once its cover is ready
+        for idx, items in self.items.items():
+            if self.books[idx] == fname:
+                self.draw_card(idx, items)
+
+    def row_height(self):
+        return self.CARD_HEIGHT + 2 * self.PAD
+
+    def column_width(self):
+        return max(1, self.canvas.winfo_width()) / self.COLUMNS
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.redraw()
+
+    def scroll(self, units):
+        self.canvas.yview_scroll(units, 'units')
+        self.redraw()
+
+    def card_box(self, idx):
+        row, col = divmod(idx, self.COLUMNS)
+        col_w = self.column_width()
+        x0 = col * col_w + self.PAD
+        y0 = row * self.row_height() + self.PAD
+        return x0, y0, x0 + col_w - 2 * self.PAD, y0 + self.CARD_HEIGHT
+
+    def redraw(self, relayout=False):
+        rows = (len(self.books) + self.COLUMNS - 1) // self.COLUMNS
+        width = self.canvas.winfo_width()
+        self.canvas.configure(scrollregion=(0, 0, width, rows * self.row_height()),
+                              yscrollincrement=self.row_height() // 3)
+        top = self.canvas.canvasy(0)
+        first_row = max(0, int(top // self.row_height()))
+        last_row = int((top + self.canvas.winfo_height()) // self.row_height())
+        visible = range(first_row * self.COLUMNS, min(len(self.books), (last_row + 1) * self.COLUMNS))
+        for idx in [i for i in self.items if i not in visible]:
+            self.hide(idx)
+        for idx in visible:
+            if idx in self.items and not relayout:
+                continue
+            if idx in self.items:
+                items = self.items[idx]
+            elif self.free:
+                items = self.free.pop()
+            else:
+                items = (self.canvas.create_rectangle(0, 0, 0, 0, outline='#c8c5bb', width=2),
+                         self.canvas.create_text(0, 0, fill='#2d3e50', font=('Segoe UI', 13, 'bold'), justify='center'),
+                         self.canvas.create_image(0, 0, anchor='w'))
+            self.draw_card(idx, items)
+
+    def draw_card(self, idx, items):
+        card, label, cover = items
+        x0, y0, x1, y1 = self.card_box(idx)
+        image = self.thumb_of(self.books[idx])
+        left = x0 + 8 + THUMB_SIZE[0] if image else x0  # title moves over for the cover
+        self.canvas.coords(card, x0, y0, x1, y1)
+        self.canvas.coords(label, (left + x1) / 2, (y0 + y1) / 2)
+        self.canvas.coords(cover, x0 + 8, (y0 + y1) / 2)
+        fill = self.SELECTED_BG if idx == self.selected else self.CARD_BG
+        self.canvas.itemconfigure(card, fill=fill, state='normal')
+        self.canvas.itemconfigure(label, text=self.title_of(self.books[idx]), width=max(20, x1 - left - 20), state='normal')
+        self.canvas.itemconfigure(cover, image=image or '', state='normal' if image else 'hidden')
+        self.items[idx] = items
+
+    def index_at(self, event):
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        row, col = int(y // self.row_height()), int(x // self.column_width())
+        idx = row * self.COLUMNS + col
+        if col >= self.COLUMNS or idx >= len(self.books):
+            return None
+        x0, y0, x1, y1 = self.card_box(idx)
+        return idx if x0 <= x <= x1 and y0 <= y <= y1 else None
+
+    def select(self, idx):
+        for i, bg in ((self.selected, self.CARD_BG), (idx, self.SELECTED_BG)):
+            if i in self.items:
+                self.canvas.itemconfigure(self.items[i][0], fill=bg)
+        self.selected = idx
+
+    def on_click(self, event):
+        idx = self.index_at(event)
+        if idx is not None:
+            self.select(idx)
+
+    def on_double_click(self, event):
+        idx = self.index_at(event)
+        if idx is not None:
+            self.on_open(self.books[idx])
+
+class EbookReaderApp(tk.Tk):
+    def __init__(self, exit_after_startup=False):
+        super().__init__()
+        self.title('Ebook Reader')
+        self.geometry('900x600')
+        self.configure(bg='#eceae4')
+        self.current_book = None
+        self.current_ext = None
+        self.current_pages = []
+        self.current_page_idx = 0
+        self.exit_after_startup = exit_after_startup
+        # Loaded by finish_startup once the first frame is up
+        self.reading_state = None
+        self.page_cache = None
+        self.library = None
+        self.search_index = None
+        self.importer = None
+        self.thumbnails = None
+        self.thumb_images = OrderedDict()  # fname -> PhotoImage, least recently drawn first
+        self.thumbs_polling = False
+        self.downloads = DownloadManager()
+        self.download_titles = {}  # fname -> title of each download in flight
+        self.download_results = ([], [])  # titles added, failure messages
+        self.downloads_polling = False
+        self.import_status = None  # [files done, files queued, added, duplicates, failures]
+        self.import_current = ('', 0, 0)  # path, bytes done, size of the file being copied
+        self.reader = None
+        self.screens = {}
+        self.current_screen = None
+        self.show_home()
+        self.bind('<Left>', lambda e: self.turn_reader_page(-1))
+        self.bind('<Right>', lambda e: self.turn_reader_page(1))
+        if PERF.enabled:
+            self.bind('<F12>', lambda e: PERF.dump())
+        # after_idle runs once the window has been drawn; the timer lets it show
+        self.after_idle(lambda: self.after(0, self.finish_startup))
+
+    def finish_startup(self):
+        first_frame = time.perf_counter() - STARTED
+        if PERF.enabled:
+            PERF.record('startup.first_frame', first_frame)
+        self.reading_state = ReadingState()
+        self.page_cache = PageCache()
+        self.library = LibraryIndex()
+        self.library.refresh()
+        # Pick up files replaced in place, which don't change the folder's mtime
+        threading.Thread(target=self.library.refresh, kwargs={'force': True}, daemon=True).start()
+        self.search_index = SearchIndex()
+        self.search_index.start_sync(self.library, self.page_cache)
+        self.importer = BookImporter(self.library, self.page_cache)
+        self.thumbnails = Thumbnailer(self.page_cache)
+        self.fill_external_recs()
+        if self.current_screen is self.screens.get('home'):
+            self.show_home()
+        self.update_idletasks()
+        home_data = time.perf_counter() - STARTED
+        if PERF.enabled:
+            PERF.record('startup.home_data', home_data)
+        if self.exit_after_startup:
+            print(f'first frame: {first_frame:.3f} s, home screen filled in: {home_data:.3f} s')
+            self.destroy()
+
+    def destroy(self):
+        if self.thumbnails:
+            self.thumbnails.close()  # queued covers would otherwise hold up the exit
+        super().destroy()
+
+    def update_perf_overlay(self):
+        # Debug overlay in the reader's corner; F12 also appends the numbers to the log
+        lines = [f'{name:18} {p50:7.1f} {p95:7.1f} ms' for name, (n, p50, p95, top) in sorted(PERF.summary().items())]
+        self.perf_overlay.config(text='\n'.join(['stage                 p50     p95'] + lines))
+        self.after(1000, self.update_perf_overlay)
+
+    def turn_reader_page(self, delta):
+        if self.reader and self.current_screen is self.screens.get('reader'):
+            self.reader.turn(delta)
+
+    def show_screen(self, name, build):
+        # Screens are built once and kept alive; switching only repacks them
+        screen = self.screens.get(name)
+        if screen is None:
+            screen = self.screens[name] = build()
+        if self.current_screen is not screen:
+            if self.current_screen is not None:
+                self.current_screen.pack_forget()
+            screen.pack(fill='both', expand=True)
+            self.current_screen = screen
+        return screen
+
+    def show_home(self):
+        self.show_screen('home', self.build_home)
+        rec = self.get_recommendation() if self.library else None
+        for widget in self.rec_frame.winfo_children():
+            widget.pack_forget()
+        if rec:
+            self.rec_heading.pack(pady=(0, 5))
+            self.rec_label.config(text=rec)
+            self.rec_label.pack(pady=(0, 15))
+
+    def build_home(self):
+        home = tk.Frame(self, bg='#eceae4')
+        # Center content
+        center = tk.Frame(home, bg='#eceae4')
+        center.place(relx=0.5, rely=0.5, anchor='center')
+        # App icon (simple emoji)
+        tk.Label(center, text='📚', bg='#eceae4', font=('Segoe UI', 48)).pack(pady=(0, 10))
+        tk.Label(center, text='Welcome to Ebook Reader', bg='#eceae4', fg='#222', font=('Segoe UI', 24, 'bold')).pack(pady=(0, 20))
+        # Filled in by show_home each time the screen is shown
+        self.rec_frame = tk.Frame(center, bg='#eceae4')
+        self.rec_frame.pack()
+        self.rec_heading = tk.Label(self.rec_frame, text='Recommended for you:', bg='#eceae4', fg='#444', font=('Segoe UI', 14, 'bold'))
+        self.rec_label = tk.Label(self.rec_frame, text='', bg='#eceae4', fg='#2d3e50', font=('Segoe UI', 16, 'bold'))
+        # Filled in by fill_external_recs after startup
+        self.ext_frame = tk.Frame(center, bg='#eceae4')
+        self.ext_frame.pack(fill='x')
+        self.download_label = tk.Label(center, text='', bg='#eceae4', fg='#888', font=('Segoe UI', 11))
+        self.download_label.pack()
+        tk.Button(center, text='Go to Library', command=self.show_library, font=('Segoe UI', 15, 'bold'), bg='#4caf50', fg='white', width=18, height=2).pack(pady=30)
+        return home
+
+    def fill_external_recs(self):
+        ext_recs = load_external_recs()
+        if not ext_recs:
+            return
+        ext_header = tk.Frame(self.ext_frame, bg='#eceae4')
+        ext_header.pack(pady=(10, 5), fill='x')
+        tk.Label(ext_header, text='Recommended from Online:', bg='#eceae4', fg='#444', font=('Segoe UI', 14, 'bold')).pack(side='left', padx=10)
+        tk.Button(ext_header, text='Add all', command=lambda: self.download_all(ext_recs), font=('Segoe UI', 10, 'bold'), bg='#bdb7a4', fg='#222').pack(side='right', padx=10)
+        for ext in ext_recs:
+            card = tk.Frame(self.ext_frame, bg='#f5f5f3', bd=1, relief='solid')
+            card.pack(pady=4, padx=10, fill='x')
+            tk.Label(card, text=ext['title'], bg='#f5f5f3', fg='#2d3e50', font=('Segoe UI', 12, 'bold')).pack(side='left', padx=10, pady=5)
+            tk.Button(card, text='Add to Library', command=lambda e=ext: self.download_external(e), font=('Segoe UI', 10, 'bold'), bg='#bdb7a4', fg='#222').pack(side='right', padx=10, pady=5)
+
+    def download_external(self, ext, quiet=False):
+        # Queues ext for download; returns whether it was queued
+        fname = external_fname(ext)
+        # If chapter, just take first 3000 bytes
+        limit = 3000 if ext['type'] == 'txt' and 'Chapter 1' in ext['title'] else None
+        if not self.downloads.add(ext['source'], fname, limit):
+            if not quiet:
+                in_library = os.path.exists(os.path.join(EBOOKS_DIR, fname))
+                messagebox.showinfo('Info', 'Ebook already in library.' if in_library else 'Ebook is already downloading.')
+            return False
+        self.download_titles[fname] = ext['title']
+        if not self.downloads_polling:
+            self.downloads_polling = True
+            self.after(200, self.poll_downloads)
+        self.show_download_progress()
+        return True
+
+    def download_all(self, ext_recs):
+        queued = [ext for ext in ext_recs if self.download_external(ext, quiet=True)]
+        if not queued and not self.download_titles:
+            messagebox.showinfo('Info', 'All recommended ebooks are already in your library.')
+
+    def show_download_progress(self):
+        count, done, total = self.downloads.progress()
+        amount = f'{done * 100 // total}%' if total else f'{done // 1024} KB'
+        self.download_label.config(text=f'Downloading {count} ebook(s)… {amount}' if count else '')
+
+    def poll_downloads(self):
+        # Everything still in flight is counted before draining events, so
+        # when nothing is left every result has already been posted
+        in_flight = self.downloads.progress()[0]
+        added, failed = self.download_results
+        finished = False
+        try:
+            while True:
+                event = self.downloads.events.get_nowait()
+                if event[0] == 'done':
+                    added.append(self.download_titles.pop(event[1]))
+                    finished = True
+                elif event[0] == 'error':
+                    failed.append(f'{self.download_titles.pop(event[1])}: {event[2]}')
+        except queue.Empty:
+            pass
+        if finished:
+            self.library.refresh(force=True)
+            self.search_index.start_sync(self.library, self.page_cache)
+        self.show_download_progress()
+        if in_flight or self.download_titles:
+            self.after(200, self.poll_downloads)
+            return
+        self.downloads_polling = False
+        self.download_results = ([], [])
+        if failed:
+            messagebox.showerror('Error', 'Failed to download:\n' + '\n'.join(failed))
+        if len(added) == 1:
+            messagebox.showinfo('Success', f'Added "{added[0]}" to library!')
+        elif added:
+            messagebox.showinfo('Success', f'Added {len(added)} ebooks to library!')
+
+    def get_recommendation(self):
+        self.library.refresh()
+        files = self.library.books()
+        if not files:
+            return None
+        last_opened = self.reading_state.last_opened()
+        unread = [f for f in files if f not in last_opened]
+        if unread:
+            return random.choice(unread)
+        # Recommend least recently opened
+        return min(files, key=last_opened.get)
+
+    def show_library(self):
+        self.show_screen('library', self.build_library)
+        self.library.refresh()
+        if self.library_grid_version != self.library.version:
+            self.library_grid_version = self.library.version
+            self.library_grid.set_books(self.library.books())
+        if not self.thumbs_polling:
+            self.thumbs_polling = True
+            self.poll_thumbnails()
+
+    def thumbnail_of(self, fname):
+        # The card's cover image, or None until the Thumbnailer has made one
+        image = self.thumb_images.get(fname)
+        if image is not None:
+            self.thumb_images.move_to_end(fname)
+            return image
+        path = self.thumbnails.get(fname)
+        if path is None:
+            return None
+        try:
+            image = tk.PhotoImage(file=path)
+        except tk.TclError:
+            return None
+        # Covers stored as they came (no MuPDF) may be full size
+        factor = max(1, -(-image.width() // THUMB_SIZE[0]), -(-image.height() // THUMB_SIZE[1]))
+        if factor > 1:
+            image = image.subsample(factor)
+        self.thumb_images[fname] = image
+        if len(self.thumb_images) > 300:  # a few screens of cards
+            self.thumb_images.popitem(last=False)
+        return image
+
+    def poll_thumbnails(self):
+        # Fills in covers as they are made while the library is showing
+        if self.current_screen is not self.screens.get('library'):
+            self.thumbs_polling = False
+            return
+        while True:
+            try:
+                fname = self.thumbnails.ready.get_nowait()
+            except queue.Empty:
+                break
+            self.thumb_images.pop(fname, None)
+            self.library_grid.refresh(fname)
+        self.after(200, self.poll_thumbnails)
+
+    def build_library(self):
+        lib_frame = tk.Frame(self, bg='#eceae4')
+        # Header
+        header = tk.Frame(lib_frame, bg='#eceae4')
+        header.pack(pady=(30, 10), fill='x')
+        tk.Button(header, text='🏠 Home', command=self.show_home, font=('Segoe UI', 13, 'bold'), bg='#bdb7a4', fg='#222', bd=0, padx=14, pady=8, activebackground='#bdb7a4', activeforeground='#222').pack(side='left', padx=10)
+        tk.Label(header, text='My Library', bg='#eceae4', fg='#222', font=('Segoe UI', 28, 'bold')).pack(side='left', padx=20)
+        upload_btn = tk.Button(header, text='＋ Add Ebook(s)', command=self.upload_ebook, font=('Segoe UI', 13, 'bold'), bg='#4caf50', fg='white', bd=0, padx=18, pady=8, activebackground='#388e3c', activeforeground='white')
+        upload_btn.pack(side='right', padx=10)
+        remove_btn = tk.Button(header, text='🗑 Remove Selected', command=self.remove_selected_ebook, font=('Segoe UI', 13, 'bold'), bg='#e53935', fg='white', bd=0, padx=18, pady=8, activebackground='#b71c1c', activeforeground='white')
+        remove_btn.pack(side='right', padx=10)
+        search_btn = tk.Button(header, text='🔍 Search', command=self.show_search, font=('Segoe UI', 13, 'bold'), bg='#bdb7a4', fg='#222', bd=0, padx=18, pady=8, activebackground='#bdb7a4', activeforeground='#222')
+        search_btn.pack(side='right', padx=10)
+        self.import_label = tk.Label(lib_frame, text='', bg='#eceae4', fg='#888', font=('Segoe UI', 11))
+        self.import_label.pack(fill='x', padx=30)
+        # Grid area; only the cards in view are drawn. Books are filled in by show_library
+        self.library_grid = LibraryGrid(lib_frame, [], self.library.title, self.open_reader_page_grid,
+                                        self.thumbnail_of, self.thumbnails.drop)
+        self.library_grid.pack(expand=True, fill='both', padx=30, pady=10)
+        self.library_grid_version = None
+        return lib_frame
+
+    def remove_selected_ebook(self):
+        grid = self.library_grid
+        if grid.selected is None:
+            messagebox.showinfo('Info', 'No ebook selected.')
+            return
+        fname = grid.books[grid.selected]
+        confirm = messagebox.askyesno('Remove Ebook', f'Are you sure you want to remove "{display_title(fname)}"?')
+        if confirm:
+            try:
+                if self.reader and self.reader.fname == fname:
+                    # Release the open file before deleting it
+                    self.reader.close()
+                    self.reader = None
+                os.remove(os.path.join(EBOOKS_DIR, fname))
+                self.reading_state.forget(fname)
+                self.thumbnails.forget(fname)
+                self.thumb_images.pop(fname, None)
+                self.library.refresh(force=True)
+                self.search_index.start_sync(self.library, self.page_cache)
+                self.show_library()
+            except Exception as e:
+                messagebox.showerror('Error', f'Failed to remove ebook: {e}')
+
+    def show_search(self):
+        win = tk.Toplevel(self)
+        win.title('Search Library')
+        win.geometry('640x420')
+        win.configure(bg='#eceae4')
+        bar = tk.Frame(win, bg='#eceae4')
+        bar.pack(fill='x', padx=10, pady=10)
+        query_var = tk.StringVar()
+        entry = tk.Entry(bar, textvariable=query_var, font=('Segoe UI', 13))
+        entry.pack(side='left', fill='x', expand=True)
+        status = tk.Label(win, text='', bg='#eceae4', fg='#888', font=('Segoe UI', 10))
+        status.pack(fill='x', padx=10)
+        results = tk.Listbox(win, bg='#f5f5f3', fg='#222', font=('Segoe UI', 11), selectbackground='#bdb7a4')
+        results.pack(fill='both', expand=True, padx=10, pady=10)
+        hits = []
+        searches = [0]  # bumped by each search, so older snippet threads stop
+        snippets = queue.Queue()
+        def run_search(*args):
+            hits[:] = self.search_index.search(query_var.get())
+            searches[0] += 1
+            results.delete(0, tk.END)
+            for fname, section, offset in hits:
+                results.insert(tk.END, f'{self.library.title(fname)}: …')
+            status.config(text=f'{len(hits)} matches' if query_var.get().strip() else '')
+            if self.search_index.syncing:
+                status.config(text=status.cget('text') + ' – still indexing the library')
+            if hits:
+                # Hits are listed at once; their snippets follow as they are read
+                threading.Thread(target=make_snippets, args=(list(hits), searches[0]), daemon=True).start()
+                win.after(50, fill_snippets, searches[0])
+        def make_snippets(found, search):
+            made = search_snippets(found, self.page_cache)
+            try:
+                for i, snippet in enumerate(made):
+                    if searches[0] != search:
+                        return
+                    snippets.put((search, i, snippet))
+            finally:
+                made.close()
+                snippets.put((search, None, None))
+        def fill_snippets(search):
+            if searches[0] != search:
+                return
+            if not win.winfo_exists():
+                searches[0] += 1  # window closed
+                return
+            selected = results.curselection()
+            try:
+                while True:
+                    done, i, snippet = snippets.get_nowait()
+                    if done != search:
+                        continue  # left over from an earlier search
+                    if i is None:
+                        return
+                    results.delete(i)
+                    results.insert(i, f'{self.library.title(hits[i][0])}: …{snippet}…')
+                    if i in selected:
+                        results.selection_set(i)
+            except queue.Empty:
+                pass
+            win.after(50, fill_snippets, search)
+        def open_hit(*args):
+            selection = results.curselection()
+            if selection:
+                fname, section, offset = hits[selection[0]]
+                searches[0] += 1
+                win.destroy()
+                self.open_reader_page_grid(fname, target=(section, offset))
+        tk.Button(bar, text='Search', command=run_search, font=('Segoe UI', 11, 'bold'), bg='#4caf50', fg='white', bd=0, padx=12, pady=4).pack(side='left', padx=(8, 0))
+        entry.bind('<Return>', run_search)
+        results.bind('<Double-Button-1>', open_hit)
+        results.bind('<Return>', open_hit)
+        entry.focus_set()
+
+    def open_reader_page_grid(self, fname, target=None):
+        ext = os.path.splitext(fname)[1].lower()
+        # PDF support check
+        if ext == '.pdf' and not HAS_FITZ:
+            messagebox.showerror('PDF Not Supported', 'PDF support requires the PyMuPDF (fitz) library. Please install it to read PDF files.')
+            return
+        self.show_screen('reader', self.build_reader)
+        self.reading_state.opened(fname)
+        if self.reader and self.reader.is_current(fname):
+            # Still loaded from last time
+            self.reader.resume()
+            if target:
+                self.reader.go_to(*target)
+            return
+        if self.reader:
+            self.reader.close()
+        if target is None:
+            # Back where the book was left, found through its page index
+            size = self.library.get(fname).get('size')
+            target = self.reading_state.position(fname, size)
+        self.reader_title.config(text=display_title(fname))
+        if ext == '.pdf':
+            self.render_check.pack(side='left', padx=(16, 2))
+        else:
+            self.render_check.pack_forget()
+        # Book is opened and paginated in the background
+        self.reader = ReaderController(self, fname, self.text_area, self.reader_page_label, self.reader_prev_btn, self.reader_next_btn, self.font_var, self.size_var, target,
+                                       self.page_image, self.render_var)
+
+    def build_reader(self):
+        reader_frame = tk.Frame(self, bg='#eceae4')
+        # Top bar
+        topbar = tk.Frame(reader_frame, bg='#f5f5f3', height=48, bd=0, relief='flat')
+        topbar.pack(side='top', fill='x')
+        tk.Button(topbar, text='🏠 Home', command=self.show_home, font=('Segoe UI', 12, 'bold'), bg='#bdb7a4', fg='#222', bd=0, padx=12, pady=6).pack(side='left', padx=10, pady=8)
+        tk.Button(topbar, text='⟵ Back to Library', command=self.show_library, font=('Segoe UI', 12, 'bold'), bg='#bdb7a4', fg='#222', bd=0, padx=12, pady=6).pack(side='left', padx=10, pady=8)
+        self.reader_title = tk.Label(topbar, text='', bg='#f5f5f3', fg='#222', font=('Segoe UI', 16, 'bold'))
+        self.reader_title.pack(side='left', padx=20, pady=8)
+        # Font controls
+        font_frame = tk.Frame(reader_frame, bg='#eceae4')
+        font_frame.pack(fill='x', pady=(5, 0))
+        tk.Label(font_frame, text='Font:', bg='#eceae4', fg='#444', font=('Segoe UI', 11)).pack(side='left', padx=(20, 2))
+        font_families = ['Georgia', 'Arial', 'Times New Roman', 'Courier New', 'Segoe UI']
+        self.font_var = tk.StringVar(value='Georgia')
+        font_menu = tk.OptionMenu(font_frame, self.font_var, *font_families)
+        font_menu.pack(side='left', padx=2)
+        tk.Label(font_frame, text='Size:', bg='#eceae4', fg='#444', font=('Segoe UI', 11)).pack(side='left', padx=(16, 2))
+        self.size_var = tk.IntVar(value=18)
+        size_menu = tk.OptionMenu(font_frame, self.size_var, *[str(s) for s in range(10, 33, 2)])
+        size_menu.pack(side='left', padx=2)
+        # PDFs can be shown as rendered pages instead of reflowed text; packed by open_reader_page_grid
+        self.render_var = tk.BooleanVar(value=False)
+        self.render_check = tk.Checkbutton(font_frame, text='Original layout', variable=self.render_var, bg='#eceae4', fg='#444', font=('Segoe UI', 11), activebackground='#eceae4')
+        # Progress/Time bar
+        info_frame = tk.Frame(reader_frame, bg='#eceae4')
+        info_frame.pack(fill='x', pady=(5, 0))
+        progress_label = tk.Label(info_frame, text='', bg='#eceae4', fg='#444', font=('Segoe UI', 12, 'bold'))
+        progress_label.pack(side='left', padx=20)
+        time_label = tk.Label(info_frame, text='', bg='#eceae4', fg='#888', font=('Segoe UI', 12))
+        time_label.pack(side='right', padx=20)
+        # Navigation
+        nav_frame = tk.Frame(reader_frame, bg='#eceae4')
+        nav_frame.pack(pady=(10, 0))
+        self.reader_prev_btn = tk.Button(nav_frame, text='⟨', font=('Segoe UI', 20, 'bold'), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222', width=3, height=1)
+        self.reader_prev_btn.pack(side='left', padx=20)
+        self.reader_page_label = tk.Label(nav_frame, text='', bg='#eceae4', fg='#888', font=('Segoe UI', 10))
+        self.reader_page_label.pack(side='left', padx=10)
+        self.reader_next_btn = tk.Button(nav_frame, text='⟩', font=('Segoe UI', 20, 'bold'), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222', width=3, height=1)
+        self.reader_next_btn.pack(side='left', padx=20)
+        # Reading text area (no scroll)
+        text_area = tk.Text(reader_frame, wrap='word', font=(self.font_var.get(), self.size_var.get()), bg='#f9fafc', fg='#222', bd=0, relief='flat', padx=30, pady=20, height=12)
+        text_area.pack(fill='both', expand=True, padx=0, pady=(0, 10))
+        text_area.config(state='disabled')
+        text_area.bind('<Configure>', lambda e: self.reader and self.reader.on_resize(e))
+        text_area.bind('<Map>', lambda e: self.reader and self.reader.resume())
+        self.text_area = text_area  # For touch_flip
+        # Placed over the text area while a PDF is shown as rendered pages
+        self.page_image = tk.Label(reader_frame, bg='#f9fafc', fg='#888', font=('Segoe UI', 12))
+        if PERF.enabled:
+            self.perf_overlay = tk.Label(reader_frame, text='', bg='#222', fg='#9f9', font=('Courier New', 9), justify='left', anchor='nw')
+            self.perf_overlay.place(relx=1, rely=1, anchor='se')
+            self.update_perf_overlay()
+        return reader_frame
+
+    def create_widgets(self):
+        self.topbar = tk.Frame(self, bg='#f5f5f3', height=40)
+        self.topbar.pack(side='top', fill='x')
+        self.title_label = tk.Label(self.topbar, text='Select an ebook', bg='#f5f5f3', fg='#222', font=('Segoe UI', 15, 'bold'))
+        self.title_label.pack(side='left', padx=20, pady=5)
+        self.sidebar = tk.Frame(self, width=180, bg='#d6d3c4')
+        self.sidebar.pack(side='left', fill='y')
+        self.library_label = tk.Label(self.sidebar, text='Library', bg='#d6d3c4', fg='#222', font=('Segoe UI', 13, 'bold'))
+        self.library_label.pack(pady=10)
+        self.library_list = tk.Listbox(self.sidebar, bg='#f5f5f3', fg='#222', font=('Segoe UI', 11), selectbackground='#bdb7a4')
+        self.library_list.pack(fill='both', expand=True, padx=10, pady=5)
+        self.library_list.bind('<<ListboxSelect>>', self.on_select_ebook)
+        self.upload_btn = tk.Button(self.sidebar, text='Upload Ebook', command=self.upload_ebook, bg='#bdb7a4', fg='#222', font=('Segoe UI', 10, 'bold'))
+        self.upload_btn.pack(pady=10, padx=10, fill='x')
+        self.reader_frame = tk.Frame(self, bg='#eceae4')
+        self.reader_frame.pack(side='right', fill='both', expand=True)
+        nav_frame = tk.Frame(self.reader_frame, bg='#eceae4')
+        nav_frame.pack(pady=10)
+        self.prev_btn = tk.Button(nav_frame, text='⟨', command=self.prev_page, font=('Segoe UI', 18), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222')
+        self.prev_btn.pack(side='left', padx=30)
+        self.page_label = tk.Label(nav_frame, text='', bg='#eceae4', fg='#888', font=('Segoe UI', 10))
+        self.page_label.pack(side='left', padx=10)
+        self.next_btn = tk.Button(nav_frame, text='⟩', command=self.next_page, font=('Segoe UI', 18), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222')
+        self.next_btn.pack(side='left', padx=30)
+        # Use a regular Text widget, no scroll
+        self.text_area = tk.Text(self.reader_frame, wrap='word', font=('Georgia', 15), bg='#f5f5f3', fg='#222', bd=0, relief='flat', padx=40, pady=20, height=12)
+        self.text_area.pack(fill='both', expand=True, padx=60, pady=10)
+        self.text_area.config(state='disabled')
+
+    def touch_flip(self, event):
+        widget = event.widget
+        # Only handle if widget is a text area
+        if not hasattr(self, 'text_area') or widget != self.text_area:
+            return
+        width = self.text_area.winfo_width()
+        x = event.x
+        if x < width // 3:
+            # Simulate left arrow
+            self.text_area.event_generate('<<PrevPage>>')
+        elif x > 2 * width // 3:
+            # Simulate right arrow
+            self.text_area.event_generate('<<NextPage>>')
+
+    def refresh_library(self):
+        self.library_list.delete(0, tk.END)
+        self.library.refresh()
+        for fname in self.library.books():
+            self.library_list.insert(tk.END, self.library.title(fname))
+
+    def upload_ebook(self):
+        # Only allow supported file types in the dialog
+        filetypes = [(f'{ext.upper()} files', f'*{ext}') for ext in SUPPORTED_EXTENSIONS]
+        file_paths = filedialog.askopenfilenames(title='Select Ebooks', filetypes=filetypes)
+        if not file_paths:
+            return
+        # Copied on the importer's thread; progress is shown on the library screen
+        self.importer.add(list(file_paths))
+        if self.import_status is None:
+            self.import_status = [0, 0, [], [], []]
+            self.after(100, self.poll_imports)
+        self.import_status[1] += len(file_paths)
+
+    def poll_imports(self):
+        done, total, added, duplicates, failed = self.import_status
+        pending = self.importer.pending  # read first, so no result can arrive after it
+        new_books = False
+        try:
+            while True:
+                event = self.importer.events.get_nowait()
+                if event[0] == 'progress':
+                    self.import_current = event[1:]
+                    continue
+                done += 1
+                if event[0] == 'added':
+                    added.append(event[2])
+                    new_books = True
+                elif event[0] == 'duplicate':
+                    duplicates.append(f'{os.path.basename(event[1])} (already in library as {event[2]})')
+                else:
+                    failed.append(f'{os.path.basename(event[1])}: {event[2]}')
+        except queue.Empty:
+            pass
+        self.import_status[0] = done
+        if new_books:
+            self.library.refresh(force=True)
+            if self.current_screen is self.screens.get('library'):
+                self.show_library()
+        if pending:
+            path, copied, size = self.import_current
+            percent = copied * 100 // size if size else 100
+            self.import_label.config(text=f'Importing {min(done + 1, total)} of {total}: {os.path.basename(path)} ({percent}%)')
+            self.after(100, self.poll_imports)
+            return
+        self.import_status = None
+        self.import_label.config(text='')
+        if added:
+            self.search_index.start_sync(self.library, self.page_cache)
+        if failed:
+            messagebox.showerror('Error', 'Failed to add ebook(s):\n' + '\n'.join(failed[:20]))
+        if duplicates:
+            more = f'\n… and {len(duplicates) - 20} more' if len(duplicates) > 20 else ''
+            messagebox.showinfo('Info', f'Added {len(added)} ebook(s). Skipped duplicates:\n' + '\n'.join(duplicates[:20]) + more)
+
+    def on_select_ebook(self, event):
+        selection = self.library_list.curselection()
+        if not selection:
+            return
+        fname = self.library_list.get(selection[0])
+        self.open_reader_window(fname)
+
+    def open_reader_window(self, fname):
+        reader_win = tk.Toplevel(self)
+        reader_win.title(fname)
+        reader_win.geometry('700x500')
+        reader_win.configure(bg='#eceae4')
+        title_label = tk.Label(reader_win, text=display_title(fname), bg='#f5f5f3', fg='#222', font=('Segoe UI', 15, 'bold'))
+        title_label.pack(side='top', fill='x', pady=5)
+        # Font controls
+        font_frame = tk.Frame(reader_win, bg='#eceae4')
+        font_frame.pack(fill='x', pady=(5, 0))
+        tk.Label(font_frame, text='Font:', bg='#eceae4', fg='#444', font=('Segoe UI', 11)).pack(side='left', padx=(20, 2))
+        font_families = ['Georgia', 'Arial', 'Times New Roman', 'Courier New', 'Segoe UI']
+        font_var = tk.StringVar(value='Georgia')
+        font_menu = tk.OptionMenu(font_frame, font_var, *font_families)
+        font_menu.pack(side='left', padx=2)
+        tk.Label(font_frame, text='Size:', bg='#eceae4', fg='#444', font=('Segoe UI', 11)).pack(side='left', padx=(16, 2))
+        size_var = tk.IntVar(value=18)
+        size_menu = tk.OptionMenu(font_frame, size_var, *[str(s) for s in range(10, 33, 2)])
+        size_menu.pack(side='left', padx=2)
+        # Navigation
+        nav_frame = tk.Frame(reader_win, bg='#eceae4')
+        nav_frame.pack(pady=10)
+        prev_btn = tk.Button(nav_frame, text='⟨', font=('Segoe UI', 18), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222')
+        prev_btn.pack(side='left', padx=30)
+        # Ensure page_label is defined before show_page
+        page_label = tk.Label(nav_frame, text='', bg='#eceae4', fg='#888', font=('Segoe UI', 10))
+        page_label.pack(side='left', padx=10)
+        next_btn = tk.Button(nav_frame, text='⟩', font=('Segoe UI', 18), bg='#eceae4', fg='#222', bd=0, activebackground='#d6d3c4', activeforeground='#222')
+        next_btn.pack(side='left', padx=30)
+        # Use a regular Text widget, no scroll
+        text_area = tk.Text(reader_win, wrap='word', font=(font_var.get(), size_var.get()), bg='#f5f5f3', fg='#222', bd=0, relief='flat', padx=40, pady=20, height=12)
+        text_area.pack(fill='both', expand=True, padx=60, pady=10)
+        text_area.config(state='disabled')
+        # Book is opened and paginated in the background
+        reader = ReaderController(self, fname, text_area, page_label, prev_btn, next_btn, font_var, size_var)
+        text_area.bind('<Configure>', reader.on_resize, add='+')
+        text_area.bind('<Map>', lambda e: reader.resume(), add='+')
+        text_area.bind('<Destroy>', lambda e: reader.close(), add='+')
+
+    def show_page(self, idx):
+        if not self.current_pages:
+            self.text_area.config(state='normal')
+            self.text_area.delete('1.0', tk.END)
+            self.text_area.insert(tk.END, 'No content.')
+            self.text_area.config(state='disabled')
+            self.page_label.config(text='')
+            self.prev_btn.config(state='disabled')
+            self.next_btn.config(state='disabled')
+            return
+        self.current_page_idx = max(0, min(idx, len(self.current_pages)-1))
+        self.text_area.config(state='normal')
+        self.text_area.delete('1.0', tk.END)
+        self.text_area.insert(tk.END, self.current_pages[self.current_page_idx])
+        self.text_area.config(state='disabled')
+        self.page_label.config(text=f'Page {self.current_page_idx+1} of {len(self.current_pages)}')
+        self.prev_btn.config(state='normal' if self.current_page_idx > 0 else 'disabled')
+        self.next_btn.config(state='normal' if self.current_page_idx < len(self.current_pages)-1 else 'disabled')
+        # Update topbar title
+        if self.current_book:
+            self.title_label.config(text=self.current_book)
+        else:
+            self.title_label.config(text='Select an ebook')
+
+    def prev_page(self):
+        if self.current_page_idx > 0:
+            self.show_page(self.current_page_idx - 1)
+
+    def next_page(self):
+        if self.current_page_idx < len(self.current_pages)-1:
+            self.show_page(self.current_page_idx + 1)
+
+    def _on_swipe_start(self, event):
+        self._swipe_x = event.x
+
+    def _on_swipe_end(self, event, show_page, state, total_pages):
+        dx = event.x - getattr(self, '_swipe_x', event.x)
+        threshold = 60  # Minimum pixels to count as a swipe
+        if dx > threshold and state['idx'] > 0:
+            show_page(state['idx']-1)
+        elif dx < -threshold and state['idx'] < total_pages-1:
+            show_page(state['idx']+1)
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()  # thumbnail workers in a PyInstaller build
+    import argparse
+    parser = argparse.ArgumentParser(description='Ebook Reader')
+    parser.add_argument('--profile', nargs='?', const='1', metavar='OPTIONS',
+                        help=f'time the reader\'s hot paths; OPTIONS may add "cprofile" and/or "tracemalloc" (same as ${PROFILE_ENV})')
+    parser.add_argument('--startup-time', action='store_true', help='print the time to the first frame and to a filled-in home screen, then exit')
+    args = parser.parse_args()
+    if args.profile and not PERF.enabled:
+        PERF.enable(args.profile)
+    app = EbookReaderApp(exit_after_startup=args.startup_time)
+    app.mainloop()
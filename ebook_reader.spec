@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('ebooks', 'ebooks')],
-    hiddenimports=['fitz', 'ebooklib', 'ebooklib.epub'],
+    hiddenimports=['fitz'],
     hookspath=['.'],
     hooksconfig={},
     runtime_hooks=[],
@@ -26,7 +26,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,  # decompressing at every launch slows startup on the Pi
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,